@@ -0,0 +1,302 @@
+'''Benchmarks for the music database. This generates synthetic catalogs of artists and songs at any scale, times loading, every mutation function and every report query, and stores the results so runs can be compared across commits.'''
+
+# Standard library imports
+import argparse
+import bisect
+import concurrent.futures
+import csv
+import datetime
+import importlib.util
+import itertools
+import json
+import multiprocessing
+import pathlib
+import random
+import resource
+import sqlite3
+import subprocess
+import time
+
+# Local imports
+import db_initialize_k363m611 as db_initialize
+
+###############################
+# Benchmark Settings
+###############################
+
+# Folder for the synthetic CSV files, the databases built from them and the stored results
+benchmark_folder_path = pathlib.Path('benchmark')
+benchmark_results_path = benchmark_folder_path / 'results.jsonl'
+
+# db_operations lives in a file whose name is not a valid module name, so it is loaded by path
+db_operations_path = pathlib.Path('db_operations_katherine.mcgaughey.py')
+
+# Default catalog size; the bulk load benchmark targets 10 million songs
+default_song_count = 10_000_000
+songs_per_artist = 20
+
+# Zipf exponent for how songs are spread over artists: 0 is uniform, 1 gives a few very prolific artists
+default_artist_skew = 1.0
+
+# Songs generated per writerows call while building songs.csv
+generate_batch_rows = 100_000
+
+# Mutations touch 1% of the catalog, capped so the largest scales still finish in minutes
+mutation_fraction = 0.01
+max_mutation_rows = 100_000
+
+genres = ['Rock', 'Pop', 'Folk', 'Jazz', 'Hip Hop', 'Grunge', 'Country', 'Electronic']
+
+report_stages = ['query_aggregation', 'query_filter', 'query_group_by', 'query_join', 'query_sorting']
+# The same five reports from the in-memory columnar engine, including the time to take its snapshot
+columnar_stages = ['columnar_reports']
+mutation_stages = ['upsert_songs (update)', 'upsert_songs (insert)', 'update_records', 'delete_records', 'delete_songs']
+
+###############################
+# Define Functions
+###############################
+
+#This will load db_operations_katherine.mcgaughey.py as a module.
+def load_db_operations():
+    """Import the db_operations script by file path and return the module."""
+    spec = importlib.util.spec_from_file_location('db_operations', db_operations_path)
+    db_operations = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(db_operations)
+    # Time the operations themselves, not the profiling around them
+    db_operations.profiling_enabled = False
+    return db_operations
+
+#This will write artists.csv and songs.csv files with the same columns as the files in the data folder.
+def generate_synthetic_catalog(folder_path, song_count, songs_per_artist=songs_per_artist, artist_skew=0.0, seed=5):
+    """Generate synthetic artists and songs CSV files and return their paths and total row count."""
+    folder_path.mkdir(parents=True, exist_ok=True)
+    artists_csv_path = folder_path / 'artists.csv'
+    songs_csv_path = folder_path / 'songs.csv'
+    rng = random.Random(seed)
+    artist_count = max(1, song_count // songs_per_artist)
+
+    with open(artists_csv_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['artist_id', 'name', 'birth_year', 'genre'])
+        writer.writerows(
+            (artist_id, f"Artist {artist_id}", rng.randint(1930, 2005), rng.choice(genres))
+            for artist_id in range(1, artist_count + 1)
+        )
+
+    # Artist k gets a share of the songs proportional to 1 / k**artist_skew
+    cumulative_weights = list(itertools.accumulate(1 / artist_id ** artist_skew for artist_id in range(1, artist_count + 1)))
+    total_weight = cumulative_weights[-1]
+
+    with open(songs_csv_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['song_id', 'title', 'release_year', 'duration', 'artist_id'])
+        for first_song_id in range(1, song_count + 1, generate_batch_rows):
+            writer.writerows(
+                (
+                    song_id,
+                    f"Song {song_id}",
+                    rng.randint(1950, 2024),
+                    f"{rng.randint(1, 9)}:{rng.randint(0, 59):02d}",
+                    bisect.bisect_left(cumulative_weights, rng.random() * total_weight) + 1,
+                )
+                for song_id in range(first_song_id, min(first_song_id + generate_batch_rows, song_count + 1))
+            )
+
+    return artists_csv_path, songs_csv_path, artist_count + song_count
+
+#This will reuse the CSV files for a scale and skew if an earlier run already generated them.
+def get_synthetic_catalog(song_count, artist_skew=default_artist_skew):
+    """Return the folder and CSV paths of a synthetic catalog, generating it the first time."""
+    folder_path = benchmark_folder_path / f"catalog_{song_count}_skew_{artist_skew}"
+    artists_csv_path = folder_path / 'artists.csv'
+    songs_csv_path = folder_path / 'songs.csv'
+    if not songs_csv_path.exists():
+        print(f"Generating {song_count:,} songs (artist skew {artist_skew}) in {folder_path}")
+        generate_synthetic_catalog(folder_path, song_count, artist_skew=artist_skew)
+    return folder_path, artists_csv_path, songs_csv_path
+
+#This will build a fresh database with one of the loaders and return how long the load took.
+def time_load(load_function, db_path, artists_csv_path, songs_csv_path):
+    """Create a fresh database, run a loader against it and return the elapsed seconds."""
+    db_path.unlink(missing_ok=True)
+    db_initialize.create_database(db_path)
+    db_initialize.create_tables(db_path, db_initialize.create_tables_sql_file_path)
+    db_initialize.create_indexes(db_path, db_initialize.create_indexes_sql_file_path)
+    db_initialize.create_summary_tables(db_path, db_initialize.create_summary_tables_sql_file_path)
+    db_initialize.create_search_tables(db_path, db_initialize.create_search_tables_sql_file_path)
+    start_time = time.perf_counter()
+    load_function(db_path, artists_csv_path, songs_csv_path)
+    return time.perf_counter() - start_time
+
+#This will compare the default pandas loader, the streaming loader and the bulk load fast path.
+def benchmark_bulk_load(song_count=default_song_count):
+    """Time each loader against the same synthetic catalog and print rows/sec for each."""
+    # The loaders import pandas on first use; import it now so the first loader isn't charged for it
+    import pandas
+    artists_csv_path, songs_csv_path, total_rows = generate_synthetic_catalog(benchmark_folder_path, song_count)
+    loaders = [
+        ("default (pandas to_sql)", db_initialize.insert_data_from_csv),
+        ("streaming", db_initialize.stream_data_from_csv),
+        ("bulk load", db_initialize.bulk_load_data_from_csv),
+    ]
+
+    results = []
+    for label, load_function in loaders:
+        db_path = benchmark_folder_path / 'bulk_load_benchmark.db'
+        elapsed_seconds = time_load(load_function, db_path, artists_csv_path, songs_csv_path)
+        with sqlite3.connect(db_path) as conn:
+            loaded_rows = sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ("artists", "songs"))
+        results.append((label, loaded_rows, elapsed_seconds, loaded_rows / elapsed_seconds))
+
+    print(f"\nBulk load benchmark: {song_count:,} songs, {total_rows:,} rows total")
+    for label, loaded_rows, elapsed_seconds, rows_per_second in results:
+        print(f"{label:<25} {loaded_rows:>12,} rows {elapsed_seconds:>9.2f}s {rows_per_second:>12,.0f} rows/sec")
+    return results
+
+#This will return the total size of a database including its write-ahead log.
+def database_size_bytes(db_path):
+    """Return the size in bytes of the database file plus its -wal file."""
+    return sum(path.stat().st_size for path in (db_path, pathlib.Path(f"{db_path}-wal")) if path.exists())
+
+#This will run one stage of the suite; it runs in its own process so the peak RSS belongs to that stage alone.
+def run_stage(stage, db_path, artists_csv_path, songs_csv_path, song_count, loader):
+    """Run a single benchmark stage and return its elapsed seconds, row count and peak RSS in KiB."""
+    mutation_count = max(1, min(int(song_count * mutation_fraction), max_mutation_rows))
+
+    if stage == 'initialize_database':
+        db_initialize.db_file_path = db_path
+        db_initialize.artists_data_path = artists_csv_path
+        db_initialize.songs_data_path = songs_csv_path
+        start_time = time.perf_counter()
+        db_initialize.initialize_database(streaming=(loader == 'streaming'), bulk=(loader == 'bulk'))
+        elapsed_seconds = time.perf_counter() - start_time
+        with sqlite3.connect(db_path) as conn:
+            rows = sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ("artists", "songs"))
+        return elapsed_seconds, rows, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    db_operations = load_db_operations()
+    output_folder_path = benchmark_folder_path / 'output'
+    output_folder_path.mkdir(parents=True, exist_ok=True)
+    start_time = time.perf_counter()
+    if stage in report_stages:
+        rows = getattr(db_operations, stage)(db_path, output_folder_path / f"{stage}.txt")
+    elif stage == 'columnar_reports':
+        db_operations.columnar_reports = True
+        rows = sum(getattr(db_operations, report)(db_path, output_folder_path / f"columnar_{report}.txt") or 0 for report in report_stages)
+    elif stage == 'upsert_songs (update)':
+        rows = db_operations.upsert_songs(db_path, (
+            {'song_id': song_id, 'title': f"Song {song_id} (Remastered)", 'release_year': 2024, 'duration': '3:30', 'artist_id': 1}
+            for song_id in range(1, mutation_count + 1)
+        ))
+    elif stage == 'upsert_songs (insert)':
+        rows = db_operations.upsert_songs(db_path, (
+            {'song_id': song_id, 'title': f"New Song {song_id}", 'release_year': 2024, 'duration': '3:30', 'artist_id': 1}
+            for song_id in range(song_count + 1, song_count + mutation_count + 1)
+        ))
+    elif stage == 'update_records':
+        # Matched on title, which is not indexed, so ten records are enough to measure the scan
+        first_song_id = mutation_count + 1
+        rows = db_operations.update_records(db_path, [{'title': f"Song {song_id}", 'duration': '4:44'} for song_id in range(first_song_id, first_song_id + 10)])
+    elif stage == 'delete_records':
+        first_song_id = mutation_count + 11
+        rows = db_operations.delete_records(db_path, [{'title': f"Song {song_id}"} for song_id in range(first_song_id, first_song_id + 10)])
+    elif stage == 'delete_songs':
+        # Removes the songs the insert stage added, so the catalog ends the size it started
+        rows = db_operations.delete_songs(db_path, range(song_count + 1, song_count + mutation_count + 1))
+    else:
+        raise ValueError(f"Unknown benchmark stage: {stage}")
+    elapsed_seconds = time.perf_counter() - start_time
+    db_operations.close_connection_pool()
+    return elapsed_seconds, rows or 0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+#This will return the commit being benchmarked so stored results can be compared across commits.
+def current_commit():
+    """Return the short git commit hash, or 'unknown' outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+#This will time initialize_database, every mutation function and every report query at each scale and store the results.
+def benchmark_suite(song_counts, artist_skew=default_artist_skew, loader='bulk'):
+    """Run the full benchmark suite and append one JSON line per stage to benchmark_results_path."""
+    commit = current_commit()
+    # A fresh interpreter per stage keeps one stage's memory out of the next stage's peak RSS
+    spawn_context = multiprocessing.get_context('spawn')
+    results = []
+
+    for song_count in song_counts:
+        folder_path, artists_csv_path, songs_csv_path = get_synthetic_catalog(song_count, artist_skew)
+        db_path = folder_path / 'music_database.db'
+        for suffix in ('', '-wal', '-shm'):
+            pathlib.Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+
+        for stage in ['initialize_database', *report_stages, *columnar_stages, *mutation_stages]:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=spawn_context) as executor:
+                elapsed_seconds, rows, peak_rss_kb = executor.submit(run_stage, stage, db_path, artists_csv_path, songs_csv_path, song_count, loader).result()
+            result = {
+                'commit': commit,
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'song_count': song_count,
+                'artist_skew': artist_skew,
+                'loader': loader,
+                'stage': stage,
+                'seconds': round(elapsed_seconds, 6),
+                'rows': rows,
+                'rows_per_second': round(rows / elapsed_seconds) if elapsed_seconds > 0 else None,
+                'peak_rss_mb': round(peak_rss_kb / 1024, 1),
+                'db_size_mb': round(database_size_bytes(db_path) / 1024 / 1024, 1),
+            }
+            results.append(result)
+            print(f"{song_count:>12,} {stage:<22} {result['seconds']:>10.3f}s {rows:>12,} rows {result['rows_per_second'] or 0:>12,} rows/sec {result['peak_rss_mb']:>8} MB RSS {result['db_size_mb']:>9} MB db")
+
+    benchmark_results_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(benchmark_results_path, 'a') as file:
+        for result in results:
+            file.write(json.dumps(result) + "\n")
+    return results
+
+#This will print the stored timings of the two most recently benchmarked commits side by side.
+def compare_benchmark_runs(results_path=benchmark_results_path):
+    """Compare the latest result of each stage between the two most recent commits."""
+    with open(results_path, 'r') as file:
+        results = [json.loads(line) for line in file if line.strip()]
+
+    commits = list(dict.fromkeys(result['commit'] for result in reversed(results)))
+    if len(commits) < 2:
+        print("Need results from at least two commits to compare")
+        return
+    newer_commit, older_commit = commits[:2]
+
+    # Later lines overwrite earlier ones, so each key keeps its most recent run
+    latest = {(result['commit'], result['song_count'], result['artist_skew'], result['stage']): result for result in results}
+    print(f"{'songs':>12} {'stage':<22} {older_commit:>11} {newer_commit:>11} {'change':>8}")
+    for (commit, song_count, artist_skew, stage), newer in latest.items():
+        older = latest.get((older_commit, song_count, artist_skew, stage))
+        if commit != newer_commit or older is None:
+            continue
+        change = (newer['seconds'] - older['seconds']) / older['seconds'] * 100 if older['seconds'] else 0.0
+        print(f"{song_count:>12,} {stage:<22} {older['seconds']:>10.3f}s {newer['seconds']:>10.3f}s {change:>+7.1f}%")
+
+#####################################
+# Conditional Execution
+#####################################
+
+# Examples:
+#   python benchmark_k363m611.py bulk 100000
+#   python benchmark_k363m611.py suite 1000 100000 10000000 --skew 1.0 --loader bulk
+#   python benchmark_k363m611.py compare
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the music database scripts")
+    parser.add_argument('command', choices=['bulk', 'suite', 'compare'])
+    parser.add_argument('song_counts', nargs='*', type=int, help="catalog sizes in songs, from 1000 up to 100000000")
+    parser.add_argument('--skew', type=float, default=default_artist_skew, help="Zipf exponent for songs per artist (0 is uniform)")
+    parser.add_argument('--loader', choices=['default', 'streaming', 'bulk'], default='bulk')
+    args = parser.parse_args()
+
+    if args.command == 'bulk':
+        benchmark_bulk_load(args.song_counts[0] if args.song_counts else default_song_count)
+    elif args.command == 'suite':
+        benchmark_suite(args.song_counts or [1_000, 100_000], args.skew, args.loader)
+    else:
+        compare_benchmark_runs()
@@ -4,22 +4,46 @@
 import sqlite3
 import pathlib
 import logging
+import logging.handlers
+import atexit
+import queue
+import random
+import csv
+import io
+import itertools
+import time
+import hashlib
+import json
+import datetime
 
 # External library imports (requires virtual environment)
-import pandas as pd
+# pandas is imported inside the functions that load CSV files with it, so importing this script stays fast
 
 ###############################
 #Logging
 ###############################
 
-# Configure logging to write to a file, appending new logs to the existing file
-logging.basicConfig(filename='log.txt', level=logging.DEBUG, filemode='a', format='%(asctime)s - %(levelname)s - %(message)s')
+# Log file and level; configure_logging() applies them when the script starts rather than on import
+log_file_path = pathlib.Path('log.txt')
+log_level = logging.DEBUG
+
+# log.txt is rotated once it reaches log_max_bytes, keeping log_backup_count old files (log.txt.1, log.txt.2, ...)
+log_max_bytes = 10 * 1024 * 1024
+log_backup_count = 5
+# Rotate on a schedule instead of by size, e.g. 'midnight' or 'H' (see logging.handlers.TimedRotatingFileHandler)
+log_rotate_when = None
+
+# Fraction of DEBUG and INFO records kept per operation, e.g. {'apply_write_group': 0.01}; warnings and errors are always kept
+log_sample_rates = {}
+
+# Records are queued by the calling thread and written to the file by this listener thread
+log_listener = None
 
 ###############################
 # File Paths
 ###############################
 
-# Paths to the CSV files
+# Paths to the CSV files; the loaders also accept a folder of CSV shards or a pattern such as data/songs-*.csv
 artists_data_path = pathlib.Path('data') / 'artists.csv'
 songs_data_path = pathlib.Path('data') / 'songs.csv'
 
@@ -28,11 +52,119 @@ db_file_path = pathlib.Path('music_database.db')
 
 #SQL file path
 create_tables_sql_file_path = pathlib.Path('sql') / 'create_tables.sql'
+create_indexes_sql_file_path = pathlib.Path('sql') / 'create_indexes.sql'
+create_sync_tables_sql_file_path = pathlib.Path('sql') / 'create_sync_tables.sql'
+create_summary_tables_sql_file_path = pathlib.Path('sql') / 'create_summary_tables.sql'
+create_search_tables_sql_file_path = pathlib.Path('sql') / 'create_search_tables.sql'
+
+###############################
+# Streaming Ingest Settings
+###############################
+
+# Set to True to stream the CSV files in bounded chunks instead of loading them whole with pandas
+streaming_ingest = False
+
+# Upper bounds for a single chunk; whichever limit is reached first closes the chunk
+chunk_rows = 50000
+chunk_bytes = 16 * 1024 * 1024
+
+# Number of chunks inserted before each commit (None leaves the transaction to the caller)
+chunks_per_transaction = 10
+
+###############################
+# Bulk Load Settings
+###############################
+
+# Set to True to run the initial load through the bulk load fast path
+bulk_load = False
+
+# PRAGMAs applied for the duration of a bulk load; the previous values are restored afterwards
+bulk_load_pragmas = {
+    "journal_mode": "MEMORY",
+    "synchronous": "OFF",
+    "cache_size": -262144,  # negative means KiB, so this is a 256 MiB page cache
+    "temp_store": "MEMORY",
+}
+
+###############################
+# Parallel Ingest Settings
+###############################
+
+# Set to True to parse the CSV files block by block in worker processes while this process inserts them as a bulk load
+parallel_ingest = False
+
+# Worker processes parsing CSV blocks; None uses one per CPU
+ingest_workers = None
+
+# Each CSV file is cut into blocks of about this many bytes, ending on a row boundary, and each block is one task,
+# so a single large songs.csv is parsed by every worker too
+ingest_block_bytes = 4 * 1024 * 1024
+
+# Blocks submitted or parsed but not yet inserted, per worker; bounds memory when parsing outruns inserting
+ingest_blocks_per_worker = 2
+
+###############################
+# Incremental Sync Settings
+###############################
+
+# Set to True to keep the existing tables and apply only the CSV rows that changed since the last sync
+incremental_sync = False
+
+# Primary key column of each table, used to match CSV rows to stored rows
+sync_key_columns = {"artists": "artist_id", "songs": "song_id"}
 
 ###############################
 # Define Functions
 ###############################
 
+#This logging filter will keep only a sample of the DEBUG and INFO records from chatty operations, following log_sample_rates.
+class LogSampler(logging.Filter):
+    """Drop a share of low-level records per operation (the function that logged) before they are queued."""
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = log_sample_rates.get(record.funcName, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+#This will configure logging so records are handed to a queue and written to a rotating log file on a background thread.
+def configure_logging():
+    """Start the log listener writing to log_file_path; does nothing if it is already running."""
+    global log_listener
+    if log_listener is not None:
+        return
+    if log_rotate_when:
+        file_handler = logging.handlers.TimedRotatingFileHandler(log_file_path, when=log_rotate_when, backupCount=log_backup_count)
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(log_file_path, maxBytes=log_max_bytes, backupCount=log_backup_count)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(LogSampler())
+    root_logger = logging.getLogger()
+    root_logger.setLevel(log_level)
+    root_logger.addHandler(queue_handler)
+
+    log_listener = logging.handlers.QueueListener(log_queue, file_handler)
+    log_listener.start()
+    # The listener thread is a daemon, so write out whatever is still queued when the interpreter exits
+    atexit.register(stop_logging)
+
+#This will write out any queued log records and stop the listener thread.
+def stop_logging():
+    """Stop the log listener after it has written every queued record."""
+    global log_listener
+    if log_listener is None:
+        return
+    listener, log_listener = log_listener, None
+    for handler in logging.getLogger().handlers[:]:
+        if isinstance(handler, logging.handlers.QueueHandler) and handler.queue is listener.queue:
+            logging.getLogger().removeHandler(handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
 def verify_and_create_folders(paths):
     """Verify and create folders if they don't exist."""
     for path in paths:
@@ -63,34 +195,475 @@ def create_tables(db_file_path, create_tables_sql_file_path):
     except sqlite3.Error as e:
         print(f"Error creating tables: {e}")
 
+#This will build the secondary indexes used by the join, filter, group by and sorting queries.
+def create_indexes(db_file_path, create_indexes_sql_file_path):
+    """Read and execute SQL statements to create indexes."""
+    try:
+        with sqlite3.connect(db_file_path) as conn:
+            with open(create_indexes_sql_file_path, "r") as file:
+                sql_script = file.read()
+            conn.executescript(sql_script)
+            print("Indexes created successfully.")
+    except sqlite3.Error as e:
+        print(f"Error creating indexes: {e}")
+
+#This will create the per-artist summary table with the triggers that keep it current, then rebuild its totals.
+def create_summary_tables(db_file_path, create_summary_tables_sql_file_path):
+    """Read and execute SQL statements to create and refresh the summary tables."""
+    try:
+        with sqlite3.connect(db_file_path) as conn:
+            with open(create_summary_tables_sql_file_path, "r") as file:
+                sql_script = file.read()
+            conn.executescript(sql_script)
+            print("Summary tables created successfully.")
+    except sqlite3.Error as e:
+        print(f"Error creating summary tables: {e}")
+
+#This will create the full-text search index over song titles and artist names with the triggers that keep it current.
+def create_search_tables(db_file_path, create_search_tables_sql_file_path):
+    """Read and execute SQL statements to create and fill the search index."""
+    try:
+        with sqlite3.connect(db_file_path) as conn:
+            with open(create_search_tables_sql_file_path, "r") as file:
+                sql_script = file.read()
+            conn.executescript(sql_script)
+            print("Search tables created successfully.")
+    except sqlite3.Error as e:
+        print(f"Error creating search tables: {e}")
+
+#This will expand a CSV path into its shards: a file is one shard, a folder holds *.csv shards and a pattern like data/songs-*.csv matches them.
+def resolve_csv_shards(csv_data_path):
+    """Return the sorted list of CSV files that a file path, folder or glob pattern refers to."""
+    csv_data_path = pathlib.Path(csv_data_path)
+    if csv_data_path.is_dir():
+        shards = sorted(csv_data_path.glob("*.csv"))
+    elif any(character in csv_data_path.name for character in "*?["):
+        shards = sorted(csv_data_path.parent.glob(csv_data_path.name))
+    else:
+        shards = [csv_data_path] if csv_data_path.exists() else []
+    if not shards:
+        raise FileNotFoundError(f"{csv_data_path} does not exist or matches no CSV files")
+    return shards
+
+#This will turn a whole column of 'm:ss' durations into integer seconds at once.
+def parse_durations(durations):
+    """Vectorized parse of 'm:ss' strings to seconds; values that don't parse become missing."""
+    import pandas as pd
+    # Only digits:digits parses, the same rule the duration triggers in create_tables.sql apply to other writers
+    durations = durations.astype("string").where(lambda values: values.str.fullmatch(r"[0-9]+:[0-9]+").fillna(False))
+    parts = durations.str.split(":", n=1, expand=True)
+    minutes = pd.to_numeric(parts[0], errors="coerce")
+    seconds = pd.to_numeric(parts[1], errors="coerce") if parts.shape[1] > 1 else float("nan")
+    return (minutes * 60 + seconds).astype("Int64")
+
 def insert_data_from_csv(db_file_path, artists_data_path, songs_data_path):
     """Read data from CSV files and insert the records into their respective tables."""
+    import pandas as pd
     try:
-        #Verify that the CSV files exist and are not empty
-        if not artists_data_path.exists():
-            raise FileNotFoundError(f"{artists_data_path} does not exist")
-        if not songs_data_path.exists():
-            raise FileNotFoundError(f"{songs_data_path} does not exist")
+        #Verify that the CSV files exist and are not empty; each path may be a folder or glob of shards
+        artists_shards = resolve_csv_shards(artists_data_path)
+        songs_shards = resolve_csv_shards(songs_data_path)
 
-        artists_df = pd.read_csv(artists_data_path)
-        songs_df = pd.read_csv(songs_data_path)
+        artists_df = pd.concat([pd.read_csv(shard) for shard in artists_shards], ignore_index=True)
+        songs_df = pd.concat([pd.read_csv(shard) for shard in songs_shards], ignore_index=True)
+        songs_df["duration_seconds"] = parse_durations(songs_df["duration"])
 
         print(f"Artists DataFrame:\n{artists_df.head()}")
         print(f"Songs DataFrame:\n{songs_df.head()}")
 
         with sqlite3.connect(db_file_path) as conn:
-            artists_df.to_sql("artists", conn, if_exists="replace", index=False)
-            songs_df.to_sql("songs", conn, if_exists="replace", index=False)
+            # Append into the tables from create_tables.sql so their keys and indexes are kept
+            artists_df.to_sql("artists", conn, if_exists="append", index=False)
+            songs_df.to_sql("songs", conn, if_exists="append", index=False)
             print("Data inserted successfully.")
     except (sqlite3.Error, pd.errors.EmptyDataError, FileNotFoundError) as e:
         print(f"Error inserting data: {e}")
 
-def initialize_database():
-    paths_to_verify = [create_tables_sql_file_path, artists_data_path, songs_data_path]
+#This will read a CSV file lazily and hand back its rows a chunk at a time.
+def read_csv_in_chunks(csv_file_path, chunk_rows=chunk_rows, chunk_bytes=chunk_bytes):
+    """Yield the CSV header with lists of rows bounded by row count and size in bytes."""
+    with open(csv_file_path, 'r', newline='') as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            raise ValueError(f"{csv_file_path} is empty")
+
+        chunk = []
+        chunk_size = 0
+        for row in reader:
+            # Empty fields become NULL, matching what pandas and to_sql would store
+            chunk.append([value if value != '' else None for value in row])
+            chunk_size += sum(len(value) for value in row) + len(row)
+            if len(chunk) >= chunk_rows or chunk_size >= chunk_bytes:
+                yield header, chunk
+                chunk = []
+                chunk_size = 0
+        if chunk:
+            yield header, chunk
+
+#This will insert one CSV file into a table chunk by chunk and report the rows/sec achieved.
+def stream_csv_into_table(conn, table_name, csv_file_path, chunk_rows=chunk_rows, chunk_bytes=chunk_bytes, chunks_per_transaction=chunks_per_transaction):
+    """Insert a CSV file into a table with executemany, committing every few chunks."""
+    start_time = time.perf_counter()
+    rows_inserted = 0
+    insert_sql = None
+
+    for chunk_number, (header, chunk) in enumerate(read_csv_in_chunks(csv_file_path, chunk_rows, chunk_bytes), start=1):
+        if insert_sql is None:
+            columns = ", ".join(f'"{column}"' for column in header)
+            placeholders = ", ".join("?" for _ in header)
+            insert_sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+
+        conn.executemany(insert_sql, chunk)
+        rows_inserted += len(chunk)
+        if chunks_per_transaction and chunk_number % chunks_per_transaction == 0:
+            conn.commit()
+    if chunks_per_transaction:
+        conn.commit()
+
+    elapsed_seconds = time.perf_counter() - start_time
+    rows_per_second = rows_inserted / elapsed_seconds if elapsed_seconds > 0 else rows_inserted
+    print(f"Streamed {rows_inserted} rows into {table_name} in {elapsed_seconds:.2f}s ({rows_per_second:,.0f} rows/sec)")
+    logging.info(f"Streamed {rows_inserted} rows into {table_name} from {csv_file_path} at {rows_per_second:,.0f} rows/sec")
+    return rows_inserted
+
+#This will load the CSV files with flat memory use, no matter how large they are.
+def stream_data_from_csv(db_file_path, artists_data_path, songs_data_path, chunk_rows=chunk_rows, chunk_bytes=chunk_bytes, chunks_per_transaction=chunks_per_transaction):
+    """Stream data from CSV files into the tables created by create_tables."""
+    try:
+        #Verify that the CSV files exist; each path may be a folder or glob of shards
+        artists_shards = resolve_csv_shards(artists_data_path)
+        songs_shards = resolve_csv_shards(songs_data_path)
+
+        with sqlite3.connect(db_file_path) as conn:
+            for shard in artists_shards:
+                stream_csv_into_table(conn, "artists", shard, chunk_rows, chunk_bytes, chunks_per_transaction)
+            for shard in songs_shards:
+                stream_csv_into_table(conn, "songs", shard, chunk_rows, chunk_bytes, chunks_per_transaction)
+            print("Data streamed successfully.")
+    except (sqlite3.Error, ValueError, FileNotFoundError) as e:
+        print(f"Error streaming data: {e}")
+
+#This will switch a connection to the import-tuned PRAGMAs and return the values they replaced.
+def apply_bulk_load_pragmas(conn, pragmas=bulk_load_pragmas):
+    """Apply bulk load PRAGMAs and return the previous settings so they can be restored."""
+    previous_pragmas = {}
+    for pragma, value in pragmas.items():
+        previous_pragmas[pragma] = conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    return previous_pragmas
+
+#This will put back the settings saved by apply_bulk_load_pragmas.
+def restore_pragmas(conn, previous_pragmas):
+    """Restore PRAGMA values saved before a bulk load."""
+    for pragma, value in previous_pragmas.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+
+#This will run each statement of a SQL script on a connection without the implicit COMMIT that executescript() issues.
+def execute_script(conn, sql_script):
+    """Execute the statements of a script one at a time inside the caller's transaction."""
+    statement = ""
+    for line in sql_script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ""
+    if statement.strip():
+        conn.execute(statement)
+
+#This will drop the secondary indexes (or triggers) on the given tables and return their SQL so they can be rebuilt.
+def drop_schema_objects(conn, table_names, object_type="index"):
+    """Drop user-created indexes or triggers on the tables and return their CREATE statements."""
+    placeholders = ", ".join("?" for _ in table_names)
+    object_rows = conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = ? AND sql IS NOT NULL AND tbl_name IN ({placeholders})",
+        [object_type, *table_names],
+    ).fetchall()
+    for object_name, _ in object_rows:
+        conn.execute(f'DROP {object_type.upper()} "{object_name}"')
+    return [object_sql for _, object_sql in object_rows]
+
+#This will type-convert a chunk of a CSV file into plain column lists, adding duration_seconds to songs.
+def prepare_csv_chunk(chunk):
+    """Return the column names and a list of values per column, with missing values as None."""
+    if "duration" in chunk.columns:
+        chunk["duration_seconds"] = parse_durations(chunk["duration"])
+    # Converting whole columns to lists is much faster than iterating over DataFrame rows
+    column_values = [
+        chunk[column].astype(object).where(chunk[column].notna(), None).tolist() if chunk[column].hasnans else chunk[column].tolist()
+        for column in chunk.columns
+    ]
+    return list(chunk.columns), column_values
+
+#This will insert column lists from prepare_csv_chunk into a table.
+def insert_csv_columns(conn, table_name, columns, column_values):
+    """Insert the rows held in column_values with executemany and return the row count."""
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    placeholders = ", ".join("?" for _ in columns)
+    conn.executemany(f"INSERT INTO {table_name} ({column_list}) VALUES ({placeholders})", zip(*column_values))
+    return len(column_values[0]) if column_values else 0
+
+#This will parse a CSV file with the pandas C parser a chunk at a time and insert each chunk column by column.
+def bulk_insert_csv_into_table(conn, table_name, csv_file_path, chunk_rows=chunk_rows):
+    """Insert a CSV file into a table with executemany without committing, returning the row count."""
+    import pandas as pd
+    rows_inserted = 0
+    for chunk in pd.read_csv(csv_file_path, chunksize=chunk_rows):
+        rows_inserted += insert_csv_columns(conn, table_name, *prepare_csv_chunk(chunk))
+    return rows_inserted
+
+#This will find where the last complete CSV row in a block of bytes ends, skipping newlines inside quoted fields.
+def last_row_end(block):
+    """Return the offset just past the last row-ending newline in block, or 0 if it holds no complete row."""
+    cut = block.rfind(b"\n")
+    quotes = block.count(b'"', 0, cut + 1)
+    # An odd number of quotes before a newline means it is inside a quoted field ("" escapes come in pairs)
+    while cut >= 0 and quotes % 2:
+        previous = block.rfind(b"\n", 0, cut)
+        quotes -= block.count(b'"', previous + 1, cut + 1)
+        cut = previous
+    return cut + 1
+
+#This will cut a CSV file into blocks of whole rows, so one large file can be parsed by several workers.
+def split_csv_blocks(csv_file_path, block_bytes=ingest_block_bytes):
+    """Yield (header, block) byte strings, each block about block_bytes long and ending at the end of a row."""
+    with open(csv_file_path, "rb") as file:
+        header = file.readline()
+        if not header.strip():
+            raise ValueError(f"{csv_file_path} is empty")
+        remainder = b""
+        while True:
+            data = file.read(block_bytes)
+            if not data:
+                break
+            block = remainder + data
+            cut = last_row_end(block)
+            # A block with no complete row (one very long row) is carried into the next read
+            if cut:
+                yield header, block[:cut]
+            remainder = block[cut:]
+        if remainder.strip():
+            yield header, remainder
+
+#This will parse one block of CSV rows in a worker process, so the parent only has to insert it.
+def parse_csv_block(header, block):
+    """Read a block of CSV rows with pandas and return prepare_csv_chunk's column names and values for it."""
+    import pandas as pd
+    return prepare_csv_chunk(pd.read_csv(io.BytesIO(header + block)))
+
+#This will parse CSV shards block by block in a process pool and insert the blocks in order, with only a few held at once.
+def parallel_insert_csv_shards(conn, shards, workers=ingest_workers, block_bytes=ingest_block_bytes, blocks_per_worker=ingest_blocks_per_worker):
+    """Insert (table_name, csv_file_path) shards on conn without committing and return the row count."""
+    import collections
+    import concurrent.futures
+    import multiprocessing
+    rows_inserted = 0
+    blocks = ((table_name, header, block) for table_name, csv_file_path in shards for header, block in split_csv_blocks(csv_file_path, block_bytes))
+    workers = workers or multiprocessing.cpu_count()
+    max_pending = workers * blocks_per_worker
+    # Spawned workers start from a clean interpreter instead of copying this process's threads and connections
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending = collections.deque()
+        for table_name, header, block in itertools.islice(blocks, max_pending):
+            pending.append((table_name, executor.submit(parse_csv_block, header, block)))
+        while pending:
+            table_name, future = pending.popleft()
+            columns, column_values = future.result()
+            # Queue the next block before inserting so the workers stay busy while this process writes
+            for next_table_name, header, block in itertools.islice(blocks, 1):
+                pending.append((next_table_name, executor.submit(parse_csv_block, header, block)))
+            rows_inserted += insert_csv_columns(conn, table_name, columns, column_values)
+    return rows_inserted
+
+#This will load both CSV files as fast as SQLite allows: tuned PRAGMAs, one transaction and indexes built once at the end.
+def bulk_load_data_from_csv(db_file_path, artists_data_path, songs_data_path, chunk_rows=chunk_rows, parallel=False, workers=ingest_workers):
+    """Bulk load data from CSV files in a single transaction with deferred index builds.
+
+    Each path may be a folder or glob of CSV shards; with parallel=True the files are parsed in blocks by worker processes.
+    """
+    try:
+        #Verify that the CSV files exist
+        shards = [("artists", shard) for shard in resolve_csv_shards(artists_data_path)]
+        shards += [("songs", shard) for shard in resolve_csv_shards(songs_data_path)]
+
+        # isolation_level=None lets us issue BEGIN/COMMIT ourselves
+        conn = sqlite3.connect(db_file_path, isolation_level=None)
+        try:
+            previous_pragmas = apply_bulk_load_pragmas(conn)
+            try:
+                start_time = time.perf_counter()
+                conn.execute("BEGIN")
+                try:
+                    index_sql = drop_schema_objects(conn, ["artists", "songs"], "index")
+                    # Triggers would fire once per row; durations are parsed in bulk and the summary is rebuilt once instead
+                    trigger_sql = drop_schema_objects(conn, ["artists", "songs"], "trigger")
+                    if parallel:
+                        rows_inserted = parallel_insert_csv_shards(conn, shards, workers)
+                    else:
+                        rows_inserted = sum(bulk_insert_csv_into_table(conn, table_name, shard, chunk_rows) for table_name, shard in shards)
+                    for create_index_sql in index_sql:
+                        conn.execute(create_index_sql)
+                    # Put the triggers back and rebuild what they maintain before committing, so a failed load never leaves the tables without them
+                    for create_trigger_sql in trigger_sql:
+                        conn.execute(create_trigger_sql)
+                    if trigger_sql:
+                        for sql_file_path in (create_summary_tables_sql_file_path, create_search_tables_sql_file_path):
+                            with open(sql_file_path, "r") as file:
+                                execute_script(conn, file.read())
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                elapsed_seconds = time.perf_counter() - start_time
+            finally:
+                restore_pragmas(conn, previous_pragmas)
+        finally:
+            conn.close()
+
+        rows_per_second = rows_inserted / elapsed_seconds if elapsed_seconds > 0 else rows_inserted
+        print(f"Bulk loaded {rows_inserted} rows from {len(shards)} CSV files in {elapsed_seconds:.2f}s ({rows_per_second:,.0f} rows/sec), rebuilt {len(index_sql)} indexes")
+        logging.info(f"Bulk loaded {rows_inserted} rows from {len(shards)} CSV files{' in parallel' if parallel else ''} at {rows_per_second:,.0f} rows/sec and rebuilt {len(index_sql)} indexes")
+    except (sqlite3.Error, ValueError, FileNotFoundError) as e:
+        print(f"Error bulk loading data: {e}")
+
+#This will check whether all of the given tables are already in the database.
+def tables_exist(db_file_path, table_names):
+    """Return True if every table in table_names exists."""
+    with sqlite3.connect(db_file_path) as conn:
+        placeholders = ", ".join("?" for _ in table_names)
+        found = conn.execute(
+            f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders})",
+            list(table_names),
+        ).fetchone()[0]
+    return found == len(table_names)
+
+#This will hash a CSV row so a changed row can be spotted without comparing every column.
+def fingerprint_row(row):
+    """Return a 16-byte fingerprint of a CSV row."""
+    row_text = "\x1f".join("" if value is None else value for value in row)
+    return hashlib.blake2b(row_text.encode(), digest_size=16).digest()
+
+#This will build an INSERT that updates every column when the key already exists.
+def build_upsert_sql(table_name, columns, key_column):
+    """Return an INSERT ... ON CONFLICT DO UPDATE statement for the columns."""
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    placeholders = ", ".join("?" for _ in columns)
+    updates = ", ".join(f'"{column}" = excluded."{column}"' for column in columns if column != key_column)
+    return f'INSERT INTO {table_name} ({column_list}) VALUES ({placeholders}) ON CONFLICT ("{key_column}") DO UPDATE SET {updates}'
+
+#This will apply only the inserted, updated and deleted rows of one CSV file to its table.
+def sync_csv_into_table(conn, table_name, csv_file_path, chunk_rows=chunk_rows, chunk_bytes=chunk_bytes):
+    """Sync a table with its CSV file using the stored row fingerprints and return the change counts."""
+    counts = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+    key_column = sync_key_columns[table_name]
+
+    # An untouched file needs no work at all
+    file_stat = csv_file_path.stat()
+    last_sync = conn.execute("SELECT csv_size, csv_mtime_ns FROM sync_files WHERE table_name = ?", (table_name,)).fetchone()
+    if last_sync == (file_stat.st_size, file_stat.st_mtime_ns):
+        print(f"{csv_file_path} is unchanged since the last sync")
+        return counts
+
+    # Keys seen in this pass; anything fingerprinted before but not seen now was deleted from the CSV
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS sync_seen_keys (row_key INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.sync_seen_keys")
+
+    upsert_sql = None
+    for header, chunk in read_csv_in_chunks(csv_file_path, chunk_rows, chunk_bytes):
+        if upsert_sql is None:
+            if key_column not in header:
+                raise ValueError(f"{csv_file_path} has no {key_column} column")
+            upsert_sql = build_upsert_sql(table_name, header, key_column)
+            key_index = header.index(key_column)
+
+        keys = []
+        for row in chunk:
+            # Rows are matched on their key, so every row needs a whole-number one
+            try:
+                keys.append(int(row[key_index]))
+            except (TypeError, ValueError, IndexError):
+                raise ValueError(f"{csv_file_path} has a row with a missing or invalid {key_column}: {row}") from None
+        stored_fingerprints = dict(conn.execute(
+            "SELECT row_key, fingerprint FROM sync_row_fingerprints WHERE table_name = ? AND row_key IN (SELECT value FROM json_each(?))",
+            (table_name, json.dumps(keys)),
+        ))
+
+        changed_rows = []
+        changed_fingerprints = []
+        for key, row in zip(keys, chunk):
+            fingerprint = fingerprint_row(row)
+            stored_fingerprint = stored_fingerprints.get(key)
+            if stored_fingerprint == fingerprint:
+                counts["unchanged"] += 1
+                continue
+            counts["inserted" if stored_fingerprint is None else "updated"] += 1
+            changed_rows.append(row)
+            changed_fingerprints.append((table_name, key, fingerprint))
+
+        conn.executemany(upsert_sql, changed_rows)
+        conn.executemany("INSERT OR REPLACE INTO sync_row_fingerprints (table_name, row_key, fingerprint) VALUES (?, ?, ?)", changed_fingerprints)
+        conn.executemany("INSERT OR IGNORE INTO temp.sync_seen_keys (row_key) VALUES (?)", ((key,) for key in keys))
+
+    deleted_keys = conn.execute(
+        "SELECT row_key FROM sync_row_fingerprints WHERE table_name = ? AND row_key NOT IN (SELECT row_key FROM temp.sync_seen_keys)",
+        (table_name,),
+    ).fetchall()
+    conn.executemany(f'DELETE FROM {table_name} WHERE "{key_column}" = ?', deleted_keys)
+    conn.executemany("DELETE FROM sync_row_fingerprints WHERE table_name = ? AND row_key = ?", ((table_name, key) for (key,) in deleted_keys))
+    counts["deleted"] = len(deleted_keys)
+
+    conn.execute(
+        "INSERT OR REPLACE INTO sync_files (table_name, csv_path, csv_size, csv_mtime_ns, synced_at) VALUES (?, ?, ?, ?, ?)",
+        (table_name, str(csv_file_path), file_stat.st_size, file_stat.st_mtime_ns, datetime.datetime.now().isoformat()),
+    )
+    return counts
+
+#This will bring the tables up to date with the CSV files, touching only the rows that changed.
+def sync_data_from_csv(db_file_path, artists_data_path, songs_data_path, chunk_rows=chunk_rows, chunk_bytes=chunk_bytes):
+    """Incrementally sync data from CSV files into their tables."""
+    try:
+        #Verify that the CSV files exist
+        if not artists_data_path.exists():
+            raise FileNotFoundError(f"{artists_data_path} does not exist")
+        if not songs_data_path.exists():
+            raise FileNotFoundError(f"{songs_data_path} does not exist")
+
+        with sqlite3.connect(db_file_path) as conn:
+            with open(create_sync_tables_sql_file_path, "r") as file:
+                conn.executescript(file.read())
+            for table_name, csv_file_path in (("artists", artists_data_path), ("songs", songs_data_path)):
+                counts = sync_csv_into_table(conn, table_name, csv_file_path, chunk_rows, chunk_bytes)
+                print(f"Synced {table_name}: {counts['inserted']} inserted, {counts['updated']} updated, {counts['deleted']} deleted, {counts['unchanged']} unchanged")
+                logging.info(f"Synced {table_name} from {csv_file_path}: {counts}")
+    except (sqlite3.Error, ValueError, FileNotFoundError) as e:
+        print(f"Error syncing data: {e}")
+
+def initialize_database(streaming=streaming_ingest, bulk=bulk_load, incremental=incremental_sync, parallel=parallel_ingest):
+    paths_to_verify = [create_tables_sql_file_path, create_indexes_sql_file_path, create_sync_tables_sql_file_path, create_summary_tables_sql_file_path, create_search_tables_sql_file_path, artists_data_path, songs_data_path]
     verify_and_create_folders(paths_to_verify)
     create_database(db_file_path)
+    if incremental:
+        # Keep the existing tables (create_tables drops them) and apply only what changed
+        if not tables_exist(db_file_path, ["artists", "songs"]):
+            create_tables(db_file_path, create_tables_sql_file_path)
+        create_indexes(db_file_path, create_indexes_sql_file_path)
+        create_summary_tables(db_file_path, create_summary_tables_sql_file_path)
+        create_search_tables(db_file_path, create_search_tables_sql_file_path)
+        sync_data_from_csv(db_file_path, artists_data_path, songs_data_path)
+        return
     create_tables(db_file_path, create_tables_sql_file_path)  # Pass arguments
-    insert_data_from_csv(db_file_path, artists_data_path, songs_data_path) 
+    create_indexes(db_file_path, create_indexes_sql_file_path)
+    create_summary_tables(db_file_path, create_summary_tables_sql_file_path)
+    create_search_tables(db_file_path, create_search_tables_sql_file_path)
+    if parallel:
+        bulk_load_data_from_csv(db_file_path, artists_data_path, songs_data_path, parallel=True, workers=ingest_workers)
+    elif bulk:
+        bulk_load_data_from_csv(db_file_path, artists_data_path, songs_data_path)
+    elif streaming:
+        stream_data_from_csv(db_file_path, artists_data_path, songs_data_path)
+    else:
+        insert_data_from_csv(db_file_path, artists_data_path, songs_data_path)
 
 if __name__ == "__main__":
+    configure_logging()
     initialize_database()
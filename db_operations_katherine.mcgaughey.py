@@ -3,16 +3,48 @@
 # Standard library imports
 import sqlite3
 import pathlib
+import os
 import logging
-import pandas as pd
+import logging.handlers
+import atexit
+import random
+import threading
+import queue
+import collections
+import sys
+import pickle
+import contextlib
+import itertools
+import functools
+import hashlib
+import re
+import csv
+import json
+import time
+import datetime
 
+# pandas, pyarrow, asyncio and concurrent.futures are imported inside the functions that use them,
+# so a single query from the command line doesn't wait hundreds of milliseconds for them to load
 
 ###############################
 #Logging
 ###############################
 
-# Configure logging to write to a file, appending new logs to the existing file
-logging.basicConfig(filename='log.txt', level=logging.DEBUG, filemode='a', format='%(asctime)s - %(levelname)s - %(message)s')
+# Log file and level; configure_logging() applies them when the script starts rather than on import
+log_file_path = pathlib.Path('log.txt')
+log_level = logging.DEBUG
+
+# log.txt is rotated once it reaches log_max_bytes, keeping log_backup_count old files (log.txt.1, log.txt.2, ...)
+log_max_bytes = 10 * 1024 * 1024
+log_backup_count = 5
+# Rotate on a schedule instead of by size, e.g. 'midnight' or 'H' (see logging.handlers.TimedRotatingFileHandler)
+log_rotate_when = None
+
+# Fraction of DEBUG and INFO records kept per operation, e.g. {'apply_write_group': 0.01}; warnings and errors are always kept
+log_sample_rates = {}
+
+# Records are queued by the calling thread and written to the file by this listener thread
+log_listener = None
 
 ###############################
 # File Paths
@@ -32,179 +64,1635 @@ join_output_file = output_folder_path / 'join_results.txt'
 sorting_output_file = output_folder_path / 'sorting_results.txt'
 
 #SQL file path
-insert_new_records_sql_path = pathlib.Path('sql') / 'insert_new_records.sql'
-delete_records_sql_path = pathlib.Path('sql') / 'delete_records.sql'
-query_aggregation_sql_path = pathlib.Path('sql') / 'query_aggregation.sql'
-query_filter_sql_path = pathlib.Path('sql') / 'query_filter.sql'
-query_group_by_sql_path = pathlib.Path('sql') / 'query_group_by.sql'
-query_join_sql_path = pathlib.Path('sql') / 'query_join.sql'
-query_sorting_sql_path = pathlib.Path('sql') / 'query_sorting.sql'
-update_records_sql_path = pathlib.Path('sql') / 'update_records.sql'
+sql_folder_path = pathlib.Path('sql')
+insert_new_records_sql_path = sql_folder_path / 'insert_new_records.sql'
+delete_records_sql_path = sql_folder_path / 'delete_records.sql'
+update_records_sql_path = sql_folder_path / 'update_records.sql'
+upsert_artists_sql_path = sql_folder_path / 'upsert_artists.sql'
+upsert_songs_sql_path = sql_folder_path / 'upsert_songs.sql'
+delete_artists_by_id_sql_path = sql_folder_path / 'delete_artists_by_id.sql'
+delete_songs_by_id_sql_path = sql_folder_path / 'delete_songs_by_id.sql'
+search_songs_sql_path = sql_folder_path / 'search_songs.sql'
+sorting_page_sql_path = sql_folder_path / 'sorting_page.sql'
+join_page_sql_path = sql_folder_path / 'join_page.sql'
+
+
+###############################
+# Connection Pool Settings
+###############################
+
+# Maximum number of open connections kept per database file
+connection_pool_size = 4
+
+# Maximum number of open read-only connections kept per database file
+read_only_connection_pool_size = 8
+
+# Idle pooled connections and the number of connections opened, keyed by (database file path, read_only)
+idle_connections = {}
+open_connection_counts = {}
+connection_pool_condition = threading.Condition()
+
+# Connections currently checked out by this thread, so nested calls on the same thread reuse them
+thread_connections = threading.local()
+
+# Size of each connection's prepared statement cache; report SQL is compiled once per connection
+cached_statements = 256
+
+###############################
+# WAL Writer Settings
+###############################
+
+# Set to True to use WAL journaling and send every write through a single writer thread per database
+wal_writer_mode = False
+
+# Seconds a connection waits for a locked database before raising "database is locked"
+busy_timeout_seconds = 5.0
+
+# Maximum number of writes waiting for the writer thread; callers block while the queue is full
+write_queue_size = 1000
+
+# Maximum number of queued writes committed together in one transaction
+group_commit_max_writes = 100
+
+# WAL pages written before SQLite checkpoints automatically (0 turns automatic checkpoints off)
+wal_autocheckpoint_pages = 1000
+
+# Checkpoint run when a writer thread stops: 'PASSIVE', 'FULL', 'RESTART', 'TRUNCATE' or None to skip it
+shutdown_checkpoint_mode = 'TRUNCATE'
+
+# NORMAL is safe from corruption in WAL mode and only risks the last commits on power loss; FULL syncs every commit
+wal_synchronous = 'NORMAL'
+
+# Write queue and thread of each database file
+writer_threads = {}
+writer_threads_lock = threading.Lock()
+
+###############################
+# Query Registry
+###############################
+
+# Report queries discovered from sql/query_*.sql, keyed by name (query_join.sql is registered as 'join')
+query_registry = {}
+
+# SQL text of each SQL file with the mtime it was read at, so files are only re-read after they change
+query_text_cache = {}
+query_registry_lock = threading.Lock()
+
+###############################
+# Query Parameters
+###############################
+
+# Parameters bound into the SQL files when the caller doesn't pass any
+default_query_params = {'filter': {'genre': 'Pop'}}
+default_update_params = {'title': 'Let It Be', 'duration': '4:30'}
+default_delete_params = {'title': 'Rocket Man'}
+
+# Number of songs search_songs() returns when no limit is given
+search_result_limit = 20
+
+###############################
+# Report Settings
+###############################
+
+# Set to True to run the five report queries at the same time on read-only connections
+concurrent_reports = False
+
+# Number of worker threads used by the concurrent report mode
+report_workers = 5
+
+###############################
+# Columnar Report Settings
+###############################
+
+# Set to True to answer the aggregation, filter, group by, join and sorting reports from an in-memory columnar
+# snapshot of artists and songs instead of SQLite. The snapshot is reloaded when database_version() changes.
+# It implements the shipped sql/query_*.sql files, so turn it off while changing those queries.
+columnar_reports = False
+
+# The artists and songs tables as pyarrow Tables, taken at one database version
+columnar_snapshot = None
+columnar_snapshot_lock = threading.Lock()
+
+###############################
+# Verification Settings
+###############################
+
+# Tables checked by verify_records and the columns that must be unique in each
+verify_key_columns = {'artists': ['artist_id'], 'songs': ['song_id']}
+
+# Number of random rows verify_records prints from each table; 0 prints none
+verify_sample_size = 5
+
+###############################
+# Page Settings
+###############################
+
+# Rows returned by query_sorting_page() and query_join_page() when no limit is given
+page_size = 100
+
+# SQLite's integer range; a first page starts from one end so its keyset bound lets every row through
+max_sqlite_integer = 2 ** 63 - 1
+min_sqlite_integer = -2 ** 63
+
+###############################
+# Async Settings
+###############################
+
+# Worker threads behind the async_* functions; one per pooled read-only connection so no worker waits for a connection
+async_workers = read_only_connection_pool_size
+
+# Executor shared by the async_* functions, created on first use
+async_executor = None
+async_executor_lock = threading.Lock()
+
+###############################
+# Result Writer Settings
+###############################
+
+# Number of rows pulled from a cursor with each fetchmany call
+fetch_batch_size = 10000
+
+# Size in bytes of the buffer used when writing result files
+write_buffer_size = 1024 * 1024
 
+# Output format for query results: 'text', 'csv', 'parquet' or 'arrow' (Arrow IPC file)
+default_output_format = 'text'
+
+# File suffix used for each output format
+output_suffixes = {'text': '.txt', 'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+# Output formats written from Arrow record batches
+columnar_output_formats = ('parquet', 'arrow')
+
+###############################
+# Result Cache Settings
+###############################
+
+# Set to False to run every report query and rewrite every output file each time
+result_cache_enabled = True
+
+# Estimated bytes of query results kept in memory; the least recently used results are evicted first
+result_cache_max_bytes = 64 * 1024 * 1024
+
+# Set to a folder (e.g. output_folder_path / 'result_cache') to also keep cached results and written-file records on disk,
+# so results evicted from memory can be read back and a later run can reuse results and skip unchanged reports.
+# That works in SQLite's default rollback-journal mode; in WAL mode the version is tied to this process
+# (see database_version()), so entries are only reused within one run.
+result_cache_folder_path = None
+
+# Cached results keyed by query, parameters and database, in least to most recently used order
+result_cache = collections.OrderedDict()
+result_cache_bytes = 0
+
+# What was last written to each output file, so unchanged reports are not rewritten
+result_output_stamps = None
+result_cache_lock = threading.RLock()
+
+# One long-lived connection per database used by database_version(), with a token identifying it in WAL mode
+version_connections = {}
+
+# Writes made through run_write in this process, per database (part of the version in WAL mode)
+local_write_counts = collections.Counter()
+version_lock = threading.Lock()
+
+###############################
+# Batch Mutation Settings
+###############################
+
+# Number of records applied with each executemany call; every batch is its own transaction
+mutation_batch_size = 5000
+
+# Column order used when records are given as dicts
+artist_columns = ['artist_id', 'name', 'birth_year', 'genre']
+song_columns = ['song_id', 'title', 'release_year', 'duration', 'album', 'artist_id']
+
+###############################
+# Profiling Settings
+###############################
+
+# Set to False to skip timing and plan collection for every operation
+profiling_enabled = True
+
+# Record EXPLAIN QUERY PLAN for each statement (cached per SQL text) and flag full table scans
+explain_query_plans = True
+
+# Set to True to append every profiled operation to profile_log_path as one JSON object per line.
+# On when this file is run as a script; library and service callers only get the in-memory totals unless they opt in.
+profile_log_enabled = __name__ == "__main__"
+profile_log_path = output_folder_path / 'profile.jsonl'
+
+# Profile records are held in memory and appended in one write by flush_profile_records(), which runs
+# from summarize_profiles(), at exit, and whenever this many records are waiting
+profile_flush_records = 1000
+profile_records = []
+profile_log_lock = threading.Lock()
+
+# Per-operation totals for the summary printed at the end of main()
+profile_totals = {}
+query_plan_cache = {}
+profile_lock = threading.Lock()
+
+# The profile record of the operation running on this thread (nested operations stack up)
+profile_state = threading.local()
 
 ###############################
 # Define Functions
 ###############################
 
+#This logging filter will keep only a sample of the DEBUG and INFO records from chatty operations, following log_sample_rates.
+class LogSampler(logging.Filter):
+    """Drop a share of low-level records per operation before they are queued.
+
+    The operation is the profiled operation running on the thread when profiling is enabled,
+    otherwise the function that logged, e.g. 'write_results_to_file'.
+    """
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        stack = getattr(profile_state, 'stack', None)
+        operation = stack[-1]['operation'] if stack else record.funcName
+        rate = log_sample_rates.get(operation, log_sample_rates.get(record.funcName, 1.0))
+        return rate >= 1.0 or random.random() < rate
+
+#This will configure logging so records are handed to a queue and written to a rotating log file on a background thread.
+def configure_logging():
+    """Start the log listener writing to log_file_path; does nothing if it is already running."""
+    global log_listener
+    if log_listener is not None:
+        return
+    if log_rotate_when:
+        file_handler = logging.handlers.TimedRotatingFileHandler(log_file_path, when=log_rotate_when, backupCount=log_backup_count)
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(log_file_path, maxBytes=log_max_bytes, backupCount=log_backup_count)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(LogSampler())
+    root_logger = logging.getLogger()
+    root_logger.setLevel(log_level)
+    root_logger.addHandler(queue_handler)
+
+    log_listener = logging.handlers.QueueListener(log_queue, file_handler)
+    log_listener.start()
+    # The listener thread is a daemon, so write out whatever is still queued when the interpreter exits
+    atexit.register(stop_logging)
+
+#This will write out any queued log records and stop the listener thread.
+def stop_logging():
+    """Stop the log listener after it has written every queued record."""
+    global log_listener
+    if log_listener is None:
+        return
+    listener, log_listener = log_listener, None
+    for handler in logging.getLogger().handlers[:]:
+        if isinstance(handler, logging.handlers.QueueHandler) and handler.queue is listener.queue:
+            logging.getLogger().removeHandler(handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+#This will turn integer seconds back into the 'm:ss' text used in songs.csv, e.g. 431 becomes '7:11'.
+def format_duration(seconds):
+    """Format a number of seconds as 'm:ss'."""
+    if seconds is None:
+        return None
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
+
+#This will wrap an operation so its wall time, rows, bytes written and query plans are recorded.
+def profile_operation(function):
+    """Decorator that profiles a db_operations function and emits a JSON line when it finishes."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not profiling_enabled:
+            return function(*args, **kwargs)
+        record = {'operation': function.__name__, 'rows': 0, 'bytes_written': 0, 'query_plan': [], 'full_table_scans': []}
+        stack = profile_state.__dict__.setdefault('stack', [])
+        stack.append(record)
+        start_time = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record['wall_time_seconds'] = round(time.perf_counter() - start_time, 6)
+            stack.pop()
+            emit_profile_record(record)
+    return wrapper
+
+#This will add rows or bytes to the profile of the operation running on this thread.
+def add_profile_metrics(rows=0, bytes_written=0):
+    """Add to the current operation's row and byte counts, if it is being profiled."""
+    stack = getattr(profile_state, 'stack', None)
+    if stack:
+        stack[-1]['rows'] += rows
+        stack[-1]['bytes_written'] += bytes_written
+
+#This will record how SQLite plans to run a statement and flag any full table scans.
+def record_query_plan(conn, sql_text, params=()):
+    """Attach the EXPLAIN QUERY PLAN of a statement to the current operation's profile."""
+    stack = getattr(profile_state, 'stack', None)
+    if not (profiling_enabled and explain_query_plans and stack):
+        return
+    query_plan = query_plan_cache.get(sql_text)
+    if query_plan is None:
+        query_plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql_text}", params)]
+        query_plan_cache[sql_text] = query_plan
+    stack[-1]['query_plan'].extend(query_plan)
+    # "SCAN songs" reads every row; "SCAN songs USING ... INDEX" walks an index and "SCAN songs_search VIRTUAL TABLE" searches the full-text index
+    stack[-1]['full_table_scans'].extend(step for step in query_plan if step.startswith('SCAN') and ' USING ' not in step and ' VIRTUAL TABLE ' not in step)
+
+#This will add one profile record to the running totals and queue it for the profile log.
+def emit_profile_record(record):
+    """Fold a profile record into profile_totals and, if profile_log_enabled, buffer it for profile_log_path."""
+    with profile_lock:
+        totals = profile_totals.setdefault(record['operation'], {'calls': 0, 'wall_time_seconds': 0.0, 'max_wall_time_seconds': 0.0, 'rows': 0, 'bytes_written': 0, 'full_table_scans': set()})
+        totals['calls'] += 1
+        totals['wall_time_seconds'] += record['wall_time_seconds']
+        totals['max_wall_time_seconds'] = max(totals['max_wall_time_seconds'], record['wall_time_seconds'])
+        totals['rows'] += record['rows']
+        totals['bytes_written'] += record['bytes_written']
+        totals['full_table_scans'].update(record['full_table_scans'])
+        if not profile_log_enabled:
+            return
+        record['timestamp'] = datetime.datetime.now().isoformat()
+        profile_records.append(record)
+        flush_due = len(profile_records) >= profile_flush_records
+    if flush_due:
+        flush_profile_records()
+
+#This will append the buffered profile records to the profile log as JSON lines.
+def flush_profile_records():
+    """Write the records buffered by emit_profile_record() to profile_log_path in one append."""
+    global profile_records
+    with profile_lock:
+        records, profile_records = profile_records, []
+    if not records:
+        return
+    try:
+        # A separate lock, so operations finishing on other threads don't wait for the file
+        with profile_log_lock:
+            profile_log_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(profile_log_path, 'a') as file:
+                file.write("".join(json.dumps(record) + "\n" for record in records))
+    except IOError as e:
+        logging.exception(f"Error writing profile records: {e}")
+
+# Records still buffered when the interpreter exits are written out
+atexit.register(flush_profile_records)
+
+#This will print and log the per-operation totals collected so far, slowest operations first.
+def summarize_profiles():
+    """Print an aggregated summary of all profiled operations and return it."""
+    flush_profile_records()
+    with profile_lock:
+        summary = sorted(profile_totals.items(), key=lambda item: item[1]['wall_time_seconds'], reverse=True)
+    print(f"{'operation':<22} {'calls':>6} {'total s':>10} {'max s':>10} {'rows':>10} {'bytes':>12}  full table scans")
+    for operation, totals in summary:
+        scans = ", ".join(sorted(totals['full_table_scans'])) or "-"
+        print(f"{operation:<22} {totals['calls']:>6} {totals['wall_time_seconds']:>10.4f} {totals['max_wall_time_seconds']:>10.4f} {totals['rows']:>10} {totals['bytes_written']:>12}  {scans}")
+        logging.info(f"Profile summary: {json.dumps({'operation': operation, **totals, 'full_table_scans': sorted(totals['full_table_scans'])})}")
+    return summary
+
+#This SQLite aggregate will combine a hash of every row into one checksum, e.g. SELECT table_checksum(artist_id, name) FROM artists.
+class TableChecksum:
+    """Order-independent checksum of the rows passed to step(), built in constant memory."""
+    def __init__(self):
+        self.checksum = 0
+
+    def step(self, *values):
+        digest = hashlib.blake2b(repr(values).encode(), digest_size=8).digest()
+        # Adding the row hashes makes the result independent of scan order
+        self.checksum = (self.checksum + int.from_bytes(digest, 'big')) % 2 ** 64
+
+    def finalize(self):
+        return f"{self.checksum:016x}"
+
+#This will open a new connection with the settings every pooled connection uses.
+def open_connection(db_file_path, read_only=False):
+    """Open a connection, read-only through a file URI if asked, with format_duration registered."""
+    if read_only:
+        db_uri = f"{pathlib.Path(db_file_path).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(db_uri, uri=True, timeout=busy_timeout_seconds, check_same_thread=False, cached_statements=cached_statements)
+    else:
+        conn = sqlite3.connect(db_file_path, timeout=busy_timeout_seconds, check_same_thread=False, cached_statements=cached_statements)
+    conn.create_function("format_duration", 1, format_duration, deterministic=True)
+    conn.create_aggregate("table_checksum", -1, TableChecksum)
+    return conn
+
+#This will hand out a warm connection from the pool instead of opening a new one for every operation.
+@contextlib.contextmanager
+def get_connection(db_file_path, read_only=False):
+    """Borrow a pooled connection, committing on success and rolling back on error."""
+    pool_key = (str(db_file_path), read_only)
+    writable_key = (str(db_file_path), False)
+    held_connections = thread_connections.__dict__.setdefault('held', {})
+    pool_size = read_only_connection_pool_size if read_only else connection_pool_size
+
+    # A thread that already holds a connection keeps using it; the outermost caller commits.
+    # Readers also reuse a held writable connection so they see that thread's own changes.
+    for held_key in (pool_key, writable_key):
+        if held_key in held_connections:
+            yield held_connections[held_key]
+            return
+
+    conn = None
+    with connection_pool_condition:
+        while True:
+            idle = idle_connections.setdefault(pool_key, [])
+            if idle:
+                conn = idle.pop()
+                break
+            if open_connection_counts.get(pool_key, 0) < pool_size:
+                open_connection_counts[pool_key] = open_connection_counts.get(pool_key, 0) + 1
+                break
+            connection_pool_condition.wait()
+
+    if conn is None:
+        try:
+            conn = open_connection(db_file_path, read_only)
+        except sqlite3.Error:
+            with connection_pool_condition:
+                open_connection_counts[pool_key] -= 1
+                connection_pool_condition.notify()
+            raise
+        logging.info(f"Opened pooled {'read-only ' if read_only else ''}connection to {db_file_path}")
+
+    held_connections[pool_key] = conn
+    try:
+        with conn:
+            yield conn
+    finally:
+        del held_connections[pool_key]
+        with connection_pool_condition:
+            idle_connections[pool_key].append(conn)
+            connection_pool_condition.notify()
+
+#This will close every idle pooled connection, for example at the end of main() or when a service shuts down.
+def close_connection_pool():
+    """Close all idle pooled connections and the version-check connections."""
+    with connection_pool_condition:
+        for pool_key, idle in idle_connections.items():
+            for conn in idle:
+                conn.close()
+            open_connection_counts[pool_key] = open_connection_counts.get(pool_key, 0) - len(idle)
+            idle.clear()
+    close_version_connections()
+
+#This will switch the database to write-ahead logging so readers and the writer don't block each other.
+def enable_wal_mode(db_file_path):
+    """Enable WAL journaling on the database."""
+    try:
+        with get_connection(db_file_path) as conn:
+            journal_mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+            logging.info(f"Journal mode for {db_file_path} is {journal_mode}")
+    except sqlite3.Error as e:
+        logging.exception(f"Error enabling WAL mode: {e}")
+
+#This will run a write on the database's writer thread in WAL writer mode, or on a pooled connection otherwise.
+def run_write(db_file_path, function):
+    """Run function(conn), which must not commit, as a write and return its result."""
+    # A write made from inside a queued write runs in the group it belongs to
+    writer_connection = getattr(thread_connections, 'writer_connection', None)
+    try:
+        if writer_connection is not None:
+            return function(writer_connection)
+        if wal_writer_mode:
+            return submit_write(db_file_path, function).result()
+        with get_connection(db_file_path) as conn:
+            return function(conn)
+    finally:
+        # Counted after the write, so a version read after run_write returns never matches one read before it
+        with version_lock:
+            local_write_counts[str(pathlib.Path(db_file_path).resolve())] += 1
+
+#This will queue a write for the database's writer thread, e.g. to wait on it from asyncio with asyncio.wrap_future().
+def submit_write(db_file_path, function):
+    """Queue function(conn) for the writer thread and return a Future with its result."""
+    # The writer adds rows and query plans to the profile of the operation that queued the write
+    import concurrent.futures
+    stack = getattr(profile_state, 'stack', None)
+    future = concurrent.futures.Future()
+    get_write_queue(db_file_path).put((function, future, stack[-1] if stack else None))
+    return future
+
+#This will start the writer thread of a database the first time something writes to it.
+def get_write_queue(db_file_path):
+    """Return the write queue of a database, switching it to WAL and starting its writer thread if needed."""
+    pool_key = str(db_file_path)
+    with writer_threads_lock:
+        if pool_key not in writer_threads:
+            # Opened here so a database that can't be opened fails the caller instead of the thread
+            conn = open_connection(db_file_path)
+            conn.isolation_level = None
+            journal_mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+            conn.execute(f"PRAGMA synchronous = {wal_synchronous}")
+            conn.execute(f"PRAGMA wal_autocheckpoint = {int(wal_autocheckpoint_pages)}")
+            write_queue = queue.Queue(maxsize=write_queue_size)
+            writer_thread = threading.Thread(target=run_writer, args=(conn, write_queue), name=f"writer {pool_key}", daemon=True)
+            writer_thread.start()
+            writer_threads[pool_key] = (write_queue, writer_thread)
+            logging.info(f"Started writer thread for {db_file_path} (journal mode {journal_mode})")
+        return writer_threads[pool_key][0]
+
+#This will apply queued writes, committing everything that has queued up since the last commit in one transaction.
+def run_writer(conn, write_queue):
+    """Writer thread loop: apply writes in group commits until a None is queued, then checkpoint and close."""
+    thread_connections.writer_connection = conn
+    stopping = False
+    while not stopping:
+        writes = [write_queue.get()]
+        while writes[-1] is not None and len(writes) < group_commit_max_writes:
+            try:
+                writes.append(write_queue.get_nowait())
+            except queue.Empty:
+                break
+        if writes[-1] is None:
+            stopping = True
+            writes.pop()
+        if writes:
+            apply_write_group(conn, writes)
+
+    try:
+        if shutdown_checkpoint_mode:
+            conn.execute(f"PRAGMA wal_checkpoint({shutdown_checkpoint_mode})")
+    except sqlite3.Error as e:
+        logging.exception(f"Error checkpointing the WAL: {e}")
+    finally:
+        conn.close()
+
+#This will commit a group of queued writes together; a write that fails is rolled back on its own.
+def apply_write_group(conn, writes):
+    """Run each write in its own savepoint inside one transaction and resolve their futures after the commit."""
+    outcomes = []
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for function, future, profile_record in writes:
+            profile_state.stack = [] if profile_record is None else [profile_record]
+            conn.execute("SAVEPOINT queued_write")
+            try:
+                outcomes.append((future, function(conn), None))
+                conn.execute("RELEASE queued_write")
+            except Exception as e:
+                conn.execute("ROLLBACK TO queued_write")
+                conn.execute("RELEASE queued_write")
+                outcomes.append((future, None, e))
+        conn.execute("COMMIT")
+    except sqlite3.Error as e:
+        logging.exception(f"Error committing {len(writes)} queued writes: {e}")
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        for _, future, _ in writes:
+            future.set_exception(e)
+        return
+    finally:
+        profile_state.stack = []
+
+    # Callers only hear back once their write is durable
+    for future, result, error in outcomes:
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+    logging.debug(f"Group committed {len(writes)} writes")
+
+#This will stop every writer thread once the writes already queued have been committed.
+def stop_writer_threads():
+    """Drain and stop the writer threads, checkpointing each database."""
+    with writer_threads_lock:
+        writers = list(writer_threads.values())
+        writer_threads.clear()
+    for write_queue, writer_thread in writers:
+        write_queue.put(None)
+        writer_thread.join()
+
+#This will run each statement of a SQL script on a connection without the implicit COMMIT that executescript() issues.
+def execute_script(conn, sql_script):
+    """Execute the statements of a script one at a time inside the caller's transaction and return the rows they changed."""
+    # rowcount counts only the rows each statement changed itself, not those written by triggers
+    changed_count = 0
+    statement = ""
+    for line in sql_script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            changed_count += max(conn.execute(statement).rowcount, 0)
+            statement = ""
+    if statement.strip():
+        changed_count += max(conn.execute(statement).rowcount, 0)
+    return changed_count
+
+@profile_operation
 def insert_new_records(db_file_path):
     """Insert new records into the database."""
     try:
-        with sqlite3.connect(db_file_path) as conn:
-            with open(insert_new_records_sql_path, 'r') as file:
-                sql_script = file.read()
-            conn.executescript(sql_script)
-            logging.info(f"Inserted new records from {insert_new_records_sql_path}")
+        with open(insert_new_records_sql_path, 'r') as file:
+            sql_script = file.read()
+
+        # Counted like update_records and delete_records: rows the statements changed, not rows the triggers wrote
+        inserted_count = run_write(db_file_path, lambda conn: execute_script(conn, sql_script))
+        add_profile_metrics(rows=inserted_count)
+        logging.info(f"Inserted {inserted_count} new records from {insert_new_records_sql_path}")
     except sqlite3.Error as e:
         logging.exception(f"Error inserting new records: {e}")
 
 
 #  This function is to help you confirm that the data has been successfully inserted into the artists and songs tables. It acts as a quick check to ensure that the database operations (like inserts) have worked as intended.
-def verify_records(db_file_path):
-    """Verify records in the tables."""
-    try:
-        with sqlite3.connect(db_file_path) as conn:
-            artists_df = pd.read_sql_query("SELECT * FROM artists", conn)
-            songs_df = pd.read_sql_query("SELECT * FROM songs", conn)
-            print("Artists DataFrame:\n", artists_df)
-            print("Songs DataFrame:\n", songs_df)
+#  Everything is computed in SQL one table scan at a time, so it runs in constant memory however big the tables are.
+@profile_operation
+def verify_records(db_file_path, sample_size=None):
+    """Verify the tables with row counts, null counts, key uniqueness, a content checksum and a random sample."""
+    sample_size = verify_sample_size if sample_size is None else sample_size
+    report = {}
+    try:
+        with get_connection(db_file_path, read_only=True) as conn:
+            for table, key_columns in verify_key_columns.items():
+                report[table] = verify_table(conn, table, key_columns, sample_size)
+                add_profile_metrics(rows=report[table]['row_count'])
+                print_verification(table, report[table])
+        return report
     except sqlite3.Error as e:
         print(f"Error verifying records: {e}")
 
+#This will compute the verification figures for one table.
+def verify_table(conn, table, key_columns, sample_size):
+    """Return the row count, per-column null counts, duplicate key count, checksum and sample rows of a table."""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    null_counts = ", ".join(f'SUM("{column}" IS NULL)' for column in columns)
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    # One scan gives the row count, every column's null count and the checksum
+    row = conn.execute(f"SELECT COUNT(*), {null_counts}, table_checksum({column_list}) FROM {table}").fetchone()
+
+    keys = ", ".join(f'"{column}"' for column in key_columns)
+    duplicate_keys = conn.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM {table} GROUP BY {keys} HAVING COUNT(*) > 1)").fetchone()[0]
+
+    sample = []
+    if sample_size:
+        # LIMIT keeps only sample_size rows in the sorter, not the whole table
+        sample = conn.execute(f"SELECT * FROM {table} ORDER BY random() LIMIT ?", (sample_size,)).fetchall()
 
-def delete_records(db_file_path):
+    return {
+        'row_count': row[0],
+        'null_counts': {column: count or 0 for column, count in zip(columns, row[1:-1])},
+        'duplicate_keys': duplicate_keys,
+        'checksum': row[-1],
+        'columns': columns,
+        'sample': sample,
+    }
+
+#This will print the verification figures for one table.
+def print_verification(table, table_report):
+    """Print a table's verification report."""
+    nulls = ", ".join(f"{column}={count}" for column, count in table_report['null_counts'].items() if count) or "none"
+    keys_status = "unique" if table_report['duplicate_keys'] == 0 else f"{table_report['duplicate_keys']} duplicated"
+    print(f"{table}: {table_report['row_count']} rows, checksum {table_report['checksum']}, keys {keys_status}, nulls: {nulls}")
+    if table_report['sample']:
+        import pandas as pd
+        print(f"Random sample of {table}:\n", pd.DataFrame(table_report['sample'], columns=table_report['columns']))
+
+#This will run one SQL statement with a single set of parameters, or with executemany for a list of them.
+def execute_with_params(conn, sql_text, params):
+    """Execute a statement with a dict/tuple of parameters or a list of them and return the rows changed."""
+    if isinstance(params, list):
+        if params:
+            record_query_plan(conn, sql_text, params[0])
+        cursor = conn.executemany(sql_text, params)
+    else:
+        record_query_plan(conn, sql_text, params)
+        cursor = conn.execute(sql_text, params)
+    add_profile_metrics(rows=max(cursor.rowcount, 0))
+    return cursor.rowcount
+
+#This will delete records, e.g. delete_records(db_file_path, [{'title': 'Rocket Man'}, {'title': 'Your Song'}]).
+@profile_operation
+def delete_records(db_file_path, params=None):
     """Delete records from the database."""
+    params = default_delete_params if params is None else params
     try:
-        with sqlite3.connect(db_file_path) as conn:
-            with open(delete_records_sql_path, 'r') as file:
-                sql_script = file.read()
-            print(f"Executing DELETE SQL:\n{sql_script}")  # Log the SQL being executed
-            conn.executescript(sql_script)
-            logging.info(f"Deleted records using {delete_records_sql_path}")
+        sql_script = load_sql_text(delete_records_sql_path)
+        print(f"Executing DELETE SQL:\n{sql_script}")  # Log the SQL being executed
+        deleted_count = run_write(db_file_path, lambda conn: execute_with_params(conn, sql_script, params))
+        logging.info(f"Deleted {deleted_count} records using {delete_records_sql_path}")
+        return deleted_count
     except sqlite3.Error as e:
         logging.exception(f"Error deleting records: {e}")
 
- #This query will produce a result set that indicates how many songs are associated with each artist.
-def query_aggregation(db_file_path, output_file_path):
-    """Perform aggregation queries and write results to a file."""
+#This will register every sql/query_*.sql file so it can be run by name.
+def discover_queries(sql_folder_path=sql_folder_path):
+    """Scan the SQL folder for query_*.sql files and return the registry."""
+    with query_registry_lock:
+        for sql_file_path in sorted(sql_folder_path.glob('query_*.sql')):
+            query_registry[sql_file_path.stem[len('query_'):]] = sql_file_path
+        return dict(query_registry)
+
+#This will return the SQL for a registered query, reading the file again only if it has changed.
+def load_query_text(name):
+    """Return the cached SQL text for a registered query."""
+    if name not in query_registry:
+        discover_queries()
+    if name not in query_registry:
+        raise ValueError(f"Unknown query: {name}")
+
+    return load_sql_text(query_registry[name])
+
+#This will return the text of a SQL file, reading the file again only if it has changed.
+def load_sql_text(sql_file_path):
+    """Return the cached text of a SQL file."""
+    modified_time = os.stat(sql_file_path).st_mtime_ns
+    with query_registry_lock:
+        cached = query_text_cache.get(sql_file_path)
+        if cached is not None and cached[0] == modified_time:
+            return cached[1]
+
+    with open(sql_file_path, 'r') as file:
+        sql_text = file.read()
+    with query_registry_lock:
+        query_text_cache[sql_file_path] = (modified_time, sql_text)
+    return sql_text
+
+#This will return a value that changes whenever any connection or process commits to the database.
+def database_version(db_file_path):
+    """Return a version of the database that changes with every commit.
+
+    In rollback-journal mode (the default) this is the file change counter from the database header and
+    PRAGMA schema_version, which every process sees alike, so versions carry over between runs. WAL commits
+    don't update the header, so in WAL mode it is this process's token, PRAGMA data_version on its
+    version-check connection and the writes made through run_write.
+    """
+    version_key = str(pathlib.Path(db_file_path).resolve())
+    with version_lock:
+        token, conn = version_connections.get(version_key, (None, None))
+        if conn is None:
+            # The token ties WAL versions to this connection; data_version values from another connection can't be compared
+            token, conn = os.urandom(8).hex(), open_connection(db_file_path, read_only=True)
+            version_connections[version_key] = (token, conn)
+        # Reading inside a read transaction holds a shared lock, so no commit lands between the header and the pragmas
+        conn.execute("BEGIN")
+        try:
+            schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+            with open(version_key, 'rb') as file:
+                header = file.read(100)
+                file_stat = os.fstat(file.fileno())
+            # data_version changes whenever any other connection, in this process or another, commits to the database
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        finally:
+            conn.execute("COMMIT")
+    # Header byte 18 is 2 for a WAL database and 1 for a rollback-journal one
+    if header[18] == 2:
+        return [token, data_version, local_write_counts[version_key]]
+    # Bytes 24-27 count the commits that changed the file; the inode and mtime tell a rebuilt file, whose count starts over, apart
+    change_counter = int.from_bytes(header[24:28], 'big')
+    return [change_counter, schema_version, file_stat.st_ino, file_stat.st_mtime_ns]
+
+#This will close the version-check connections, e.g. when shutting down; versions taken before no longer match.
+def close_version_connections():
+    """Close every connection opened by database_version()."""
+    with version_lock:
+        for _, conn in version_connections.values():
+            conn.close()
+        version_connections.clear()
+
+#This will tell whether a query on this thread can use the result cache.
+def result_cache_usable(db_file_path):
+    """Return False if caching is off or this thread has uncommitted writes that a rollback could undo."""
+    held_connections = getattr(thread_connections, 'held', {})
+    return result_cache_enabled and (str(db_file_path), False) not in held_connections
+
+#This will return the cache key of a query, which is also used as its file name in result_cache_folder_path.
+def result_cache_key(db_file_path, sql_text, params):
+    """Hash the database path, SQL text and parameters into a hex key."""
+    params = sorted(params.items()) if isinstance(params, dict) else params
+    key_text = repr((str(pathlib.Path(db_file_path).resolve()), sql_text, params))
+    return hashlib.blake2b(key_text.encode(), digest_size=16).hexdigest()
+
+#This will estimate how much memory a batch of rows takes up.
+def estimate_rows_size(rows):
+    """Return the approximate size in bytes of a list of row tuples."""
+    return sys.getsizeof(rows) + sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in rows)
+
+#This will return a cached result if it was stored at the same database version.
+def get_cached_result(key, version):
+    """Return the cached entry for key from memory or disk, or None if it is missing or stale."""
+    global result_cache_bytes
+    with result_cache_lock:
+        entry = result_cache.get(key)
+        if entry is not None:
+            if entry['version'] == version:
+                result_cache.move_to_end(key)
+                return entry
+            del result_cache[key]
+            result_cache_bytes -= entry['size']
+
+    if result_cache_folder_path is not None:
+        cache_file_path = result_cache_folder_path / f"{key}.pickle"
+        try:
+            with open(cache_file_path, 'rb') as file:
+                entry = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except (IOError, pickle.UnpicklingError, EOFError) as e:
+            logging.exception(f"Error reading cached result {cache_file_path}: {e}")
+            return None
+        if entry['version'] == version:
+            add_result_to_memory(key, entry)
+            return entry
+    return None
+
+#This will keep a result in memory, evicting the least recently used results to stay under result_cache_max_bytes.
+def add_result_to_memory(key, entry):
+    """Add an entry to the in-memory LRU cache if it fits."""
+    global result_cache_bytes
+    if entry['size'] > result_cache_max_bytes:
+        return
+    with result_cache_lock:
+        previous = result_cache.pop(key, None)
+        if previous is not None:
+            result_cache_bytes -= previous['size']
+        result_cache[key] = entry
+        result_cache_bytes += entry['size']
+        while result_cache_bytes > result_cache_max_bytes:
+            _, evicted = result_cache.popitem(last=False)
+            result_cache_bytes -= evicted['size']
+
+#This will store a query result in memory and, if result_cache_folder_path is set, on disk.
+def store_cached_result(key, version, column_names, rows, size=None):
+    """Cache the rows of a query result and return the new entry."""
+    entry = {'version': version, 'column_names': column_names, 'rows': rows, 'size': estimate_rows_size(rows) if size is None else size}
+    add_result_to_memory(key, entry)
+    if result_cache_folder_path is not None:
+        try:
+            result_cache_folder_path.mkdir(parents=True, exist_ok=True)
+            temporary_path = result_cache_folder_path / f"{key}.pickle.tmp"
+            with open(temporary_path, 'wb') as file:
+                pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+            # Renaming keeps readers from ever seeing a half-written file
+            os.replace(temporary_path, result_cache_folder_path / f"{key}.pickle")
+        except IOError as e:
+            logging.exception(f"Error writing cached result {key}: {e}")
+    return entry
+
+#This will empty the result cache, for example after changing the database outside these scripts.
+def clear_result_cache():
+    """Remove every cached result and written-file record from memory and disk."""
+    global result_cache_bytes, result_output_stamps
+    with result_cache_lock:
+        result_cache.clear()
+        result_cache_bytes = 0
+        result_output_stamps = None
+        if result_cache_folder_path is not None and result_cache_folder_path.exists():
+            for cache_file_path in result_cache_folder_path.glob('*'):
+                cache_file_path.unlink()
+
+#This will return the size and mtime of a file, or None if it doesn't exist.
+def file_stamp(file_path):
+    """Return [size, mtime_ns] for a file, or None."""
     try:
-        with sqlite3.connect(db_file_path) as conn:
-            with open(query_aggregation_sql_path, 'r') as file:
-                sql_script = file.read()
+        file_stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return [file_stat.st_size, file_stat.st_mtime_ns]
 
-            cursor = conn.cursor()
-            cursor.execute(sql_script)
-            
-            results = cursor.fetchall()
-            write_results_to_file(results, output_file_path, "Aggregation Query Results")
-    except sqlite3.Error as e:
-        logging.exception(f"Error executing aggregation queries: {e}")
+#This will return the records of what was last written to each output file, loading them from disk the first time.
+def get_output_stamps():
+    """Return the dict of output file records, keyed by output file path."""
+    global result_output_stamps
+    with result_cache_lock:
+        if result_output_stamps is None:
+            result_output_stamps = {}
+            if result_cache_folder_path is not None:
+                try:
+                    with open(result_cache_folder_path / 'outputs.json', 'r') as file:
+                        result_output_stamps = json.load(file)
+                except FileNotFoundError:
+                    pass
+                except (IOError, ValueError) as e:
+                    logging.exception(f"Error reading output records: {e}")
+        return result_output_stamps
 
-#This filters data by a specified data element (like filtering all of the pop songs).
-def query_filter(db_file_path, output_file_path):
-    """Perform filtered queries."""
+#This will record what was written to an output file so the same report isn't written again.
+def record_output_stamp(output_file_path, report_stamp, row_count):
+    """Remember the report and file stamp of an output file, on disk too if result_cache_folder_path is set."""
+    with result_cache_lock:
+        output_stamps = get_output_stamps()
+        output_stamps[str(output_file_path)] = {'report': report_stamp, 'file': file_stamp(output_file_path), 'row_count': row_count}
+        if result_cache_folder_path is not None:
+            try:
+                result_cache_folder_path.mkdir(parents=True, exist_ok=True)
+                with open(result_cache_folder_path / 'outputs.json', 'w') as file:
+                    json.dump(output_stamps, file)
+            except IOError as e:
+                logging.exception(f"Error writing output records: {e}")
+
+#This will pass batches through to a writer while keeping a copy of them for the cache, until they outgrow it.
+def collect_batches(batches, collected):
+    """Yield each batch, appending its rows to collected['rows'] while they fit in result_cache_max_bytes."""
+    for batch in batches:
+        if collected['rows'] is not None:
+            collected['size'] += estimate_rows_size(batch)
+            if collected['size'] > result_cache_max_bytes:
+                # Too big to cache; stop holding on to rows so the write stays streaming
+                collected['rows'] = None
+            else:
+                collected['rows'].extend(batch)
+        yield batch
+
+#This will run a registered query and return all of its rows, e.g. run_query('join').
+@profile_operation
+def run_query(name, params=None, db_file_path=db_file_path):
+    """Execute a registered report query on a pooled read-only connection and return its rows."""
+    params = default_query_params.get(name, ()) if params is None else params
+    if columnar_reports_usable(name, db_file_path):
+        table = run_columnar_report(name, params, db_file_path)
+        if table is not None:
+            rows = list(itertools.chain.from_iterable(iter_table_batches(table)))
+            add_profile_metrics(rows=len(rows))
+            return rows
+
+    sql_text = load_query_text(name)
+    use_cache = result_cache_usable(db_file_path)
+    if use_cache:
+        # The version is read before the query, so a commit that lands during it only makes the entry stale sooner
+        key = result_cache_key(db_file_path, sql_text, params)
+        version = database_version(db_file_path)
+        entry = get_cached_result(key, version)
+        if entry is not None:
+            add_profile_metrics(rows=len(entry['rows']))
+            return entry['rows']
+
+    with get_connection(db_file_path, read_only=True) as conn:
+        # The same SQL text each time lets sqlite3 reuse the statement it prepared on this connection
+        record_query_plan(conn, sql_text, params)
+        cursor = conn.execute(sql_text, params)
+        rows = cursor.fetchall()
+        add_profile_metrics(rows=len(rows))
+    if use_cache:
+        store_cached_result(key, version, [column[0] for column in cursor.description], rows)
+    return rows
+
+#This will run a registered query and stream its results straight to a file.
+def run_query_to_file(name, db_file_path, output_file_path, title, output_format=default_output_format, params=None):
+    """Execute a registered report query and write its results to a file."""
+    params = default_query_params.get(name, ()) if params is None else params
     try:
-        with sqlite3.connect(db_file_path) as conn:
-            with open(query_filter_sql_path, 'r') as file:
-                sql_script = file.read()
-        
-            cursor = conn.cursor()
-            cursor.execute(sql_script)
-            
-            # Fetch all results
-            results = cursor.fetchall()
-            
-            # Write results to a file
-            write_results_to_file(results, output_file_path, "Filtered Query Results")
+        if columnar_reports_usable(name, db_file_path):
+            table = run_columnar_report(name, params, db_file_path)
+            if table is not None:
+                return write_results_to_file(table, output_file_path, title, output_format=output_format)
+        sql_text = load_query_text(name)
+        if result_cache_usable(db_file_path):
+            return run_cached_query_to_file(db_file_path, sql_text, params, output_file_path, title, output_format)
+        with get_connection(db_file_path, read_only=True) as conn:
+            record_query_plan(conn, sql_text, params)
+            cursor = conn.execute(sql_text, params)
+            return write_results_to_file(cursor, output_file_path, title, output_format=output_format)
     except sqlite3.Error as e:
-        logging.exception(f"Error executing filtered queries: {e}")
+        logging.exception(f"Error executing {name} query: {e}")
+
+#This will write a report through the result cache, skipping the query and the file write when nothing has changed.
+def run_cached_query_to_file(db_file_path, sql_text, params, output_file_path, title, output_format=default_output_format):
+    """Write a query's results to a file, reusing cached rows and leaving an up-to-date file untouched."""
+    key = result_cache_key(db_file_path, sql_text, params)
+    version = database_version(db_file_path)
+    final_output_path = pathlib.Path(output_file_path).with_suffix(output_suffixes.get(output_format, ''))
+    report_stamp = hashlib.blake2b(repr((key, version, output_format, title)).encode(), digest_size=16).hexdigest()
+
+    written = get_output_stamps().get(str(final_output_path))
+    if written is not None and written['report'] == report_stamp and written['file'] == file_stamp(final_output_path):
+        logging.info(f"Skipped {final_output_path}; the query and database have not changed since it was written")
+        return written['row_count']
+
+    column_types = None
+    if output_format in columnar_output_formats:
+        with get_connection(db_file_path, read_only=True) as conn:
+            column_types = declared_column_types(conn)
+
+    entry = get_cached_result(key, version)
+    if entry is not None:
+        row_count = write_results_to_file(entry['rows'], output_file_path, title, output_format=output_format, column_names=entry['column_names'], column_types=column_types)
+    else:
+        collected = {'rows': [], 'size': 0}
+        with get_connection(db_file_path, read_only=True) as conn:
+            record_query_plan(conn, sql_text, params)
+            cursor = conn.execute(sql_text, params)
+            column_names = [column[0] for column in cursor.description]
+            rows = itertools.chain.from_iterable(collect_batches(iter_result_batches(cursor), collected))
+            row_count = write_results_to_file(rows, output_file_path, title, output_format=output_format, column_names=column_names, column_types=column_types)
+        if row_count is not None and collected['rows'] is not None:
+            store_cached_result(key, version, column_names, collected['rows'], collected['size'])
+
+    if row_count is not None:
+        record_output_stamp(final_output_path, report_stamp, row_count)
+    return row_count
+
+#This query will produce a result set that indicates how many songs are associated with each artist.
+@profile_operation
+def query_aggregation(db_file_path, output_file_path, output_format=default_output_format):
+    """Perform aggregation queries and write results to a file."""
+    return run_query_to_file('aggregation', db_file_path, output_file_path, "Aggregation Query Results", output_format)
+
+#This filters data by a specified data element (like filtering all of the pop songs), e.g. params={'genre': 'Rock'}.
+@profile_operation
+def query_filter(db_file_path, output_file_path, output_format=default_output_format, params=None):
+    """Perform filtered queries."""
+    return run_query_to_file('filter', db_file_path, output_file_path, "Filtered Query Results", output_format, params)
 
 #This will query the database and group the data (like showing how many songs each artist has in the table with one row for each artist).
-def query_group_by(db_file_path, output_file_path):
+@profile_operation
+def query_group_by(db_file_path, output_file_path, output_format=default_output_format):
     """Perform queries with GROUP BY clause."""
+    return run_query_to_file('group_by', db_file_path, output_file_path, "GROUP BY Query Results", output_format)
+
+#This will join columns from tables together (like joining the artist with the song name).
+@profile_operation
+def query_join(db_file_path, output_file_path, output_format=default_output_format):
+    """Perform queries with JOIN operations."""
+    return run_query_to_file('join', db_file_path, output_file_path, "JOIN Query Results", output_format)
+
+#This will query the database and sort specified data (like sorting songs by publiscation date).
+@profile_operation
+def query_sorting(db_file_path, output_file_path, output_format=default_output_format):
+    """Perform sorting queries."""
+    return run_query_to_file('sorting', db_file_path, output_file_path, "Sorting Query Results", output_format)
+
+#This will run a keyset page query and work out where the next page starts.
+def run_page_query(db_file_path, sql_file_path, params, key_columns):
+    """Return a page of rows and the values of key_columns in its last row, or None as the key after the last page."""
+    sql_text = load_sql_text(sql_file_path)
+    with get_connection(db_file_path, read_only=True) as conn:
+        record_query_plan(conn, sql_text, params)
+        cursor = conn.execute(sql_text, params)
+        rows = cursor.fetchall()
+        column_names = [column[0].lower() for column in cursor.description]
+    add_profile_metrics(rows=len(rows))
+    # A short page is the last one
+    if len(rows) < params['limit']:
+        return rows, None
+    return rows, tuple(rows[-1][column_names.index(column)] for column in key_columns)
+
+#This will return a page of the sorting report, e.g. rows, after = query_sorting_page(db_file_path, 50, after) (the first page is the top 50).
+@profile_operation
+def query_sorting_page(db_file_path, limit=page_size, after=None):
+    """Return (rows, after) for the songs after the (release_year, song_id) key after, newest first."""
+    if after is None:
+        bounds = {'after_release_year': max_sqlite_integer, 'after_song_id': max_sqlite_integer, 'after_null_song_id': max_sqlite_integer}
+    elif after[0] is None:
+        # The previous page ended among the songs without a release year, which come last
+        bounds = {'after_release_year': min_sqlite_integer, 'after_song_id': min_sqlite_integer, 'after_null_song_id': after[1]}
+    else:
+        bounds = {'after_release_year': after[0], 'after_song_id': after[1], 'after_null_song_id': max_sqlite_integer}
+    return run_page_query(db_file_path, sorting_page_sql_path, {**bounds, 'limit': limit}, ('release_year', 'song_id'))
+
+#This will return a page of the join report in (artist_id, song_id) order, e.g. rows, after = query_join_page(db_file_path, 50, after).
+@profile_operation
+def query_join_page(db_file_path, limit=page_size, after=None):
+    """Return (rows, after) for the artist/song pairs after the (artist_id, song_id) key after."""
+    after_artist_id, after_song_id = (min_sqlite_integer, min_sqlite_integer) if after is None else after
+    params = {'after_artist_id': after_artist_id, 'after_song_id': after_song_id, 'limit': limit}
+    return run_page_query(db_file_path, join_page_sql_path, params, ('artist_id', 'song_id'))
+
+#This will update a record already in the database, e.g. update_records(db_file_path, {'title': 'Let It Be', 'duration': '4:03'}).
+@profile_operation
+def update_records(db_file_path, params=None):
+    """Update records in the database."""
+    params = default_update_params if params is None else params
     try:
-        with sqlite3.connect(db_file_path) as conn:
-            with open(query_group_by_sql_path, 'r') as file:
-                sql_script = file.read()
-        
-            cursor = conn.cursor()
-            cursor.execute(sql_script)
-            
-            results = cursor.fetchall()
-            write_results_to_file(results, output_file_path, "GROUP BY Query Results")
+        sql_script = load_sql_text(update_records_sql_path)
+        updated_count = run_write(db_file_path, lambda conn: execute_with_params(conn, sql_script, params))
+        print(f"Executing UPDATE SQL:\n{sql_script}")  # Log the SQL being executed
+        logging.info(f"Updated {updated_count} records using {update_records_sql_path}")
+        return updated_count
     except sqlite3.Error as e:
+        logging.exception(f"Error updating records: {e}")
 
-            logging.info(f"Executed GROUP BY queries from {query_group_by_sql_path}")
-    except sqlite3.Error as e:
-        logging.exception(f"Error executing GROUP BY queries: {e}")
+#This will pull rows from a cursor (with fetchmany) or any other iterable a batch at a time.
+def iter_result_batches(results, batch_size=fetch_batch_size):
+    """Yield lists of at most batch_size rows."""
+    if hasattr(results, 'fetchmany'):
+        while True:
+            batch = results.fetchmany(batch_size)
+            if not batch:
+                return
+            yield batch
+    else:
+        rows = iter(results)
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                return
+            yield batch
 
+#This will split a pyarrow Table into lists of row tuples, or into record batches for the Parquet and Arrow writers.
+def iter_table_batches(table, batch_size=fetch_batch_size, as_rows=True):
+    """Yield lists of at most batch_size row tuples, or pyarrow RecordBatches if as_rows is False."""
+    for record_batch in table.to_batches(max_chunksize=batch_size):
+        # Dictionary-encoded columns decode back to their values here
+        yield list(zip(*(column.to_pylist() for column in record_batch.columns))) if as_rows else record_batch
 
-#This will join columns from tables together (like joining the artist with the song name).
-def query_join(db_file_path, output_file_path):
-    """Perform queries with JOIN operations."""
+#This will turn dict records into tuples in column order; tuples are passed through as they are.
+def records_to_rows(records, columns):
+    """Yield parameter tuples for records given as dicts or tuples."""
+    for record in records:
+        if isinstance(record, dict):
+            # Missing keys are stored as NULL
+            yield tuple(record.get(column) for column in columns)
+        else:
+            yield tuple(record)
+
+#This will run one statement over many rows with executemany, committing after every batch.
+def apply_in_batches(db_file_path, sql_file_path, rows, batch_size=mutation_batch_size):
+    """Apply rows in batch_size transactions and return the number of rows changed."""
     try:
-        with sqlite3.connect(db_file_path) as conn:
-            with open(query_join_sql_path, 'r') as file:
-                sql_script = file.read()
+        sql_text = load_sql_text(sql_file_path)
+        changed_count = 0
+        batch_count = 0
+
+        def apply_batch(conn, batch, first_batch):
+            if first_batch:
+                record_query_plan(conn, sql_text, batch[0])
+            return conn.executemany(sql_text, batch).rowcount
 
-            cursor = conn.cursor()
-            cursor.execute(sql_script)
-            
-            results = cursor.fetchall()
-            write_results_to_file(results, output_file_path, "JOIN Query Results")
+        for batch in iter_result_batches(rows, batch_size):
+            changed_count += run_write(db_file_path, functools.partial(apply_batch, batch=batch, first_batch=batch_count == 0))
+            batch_count += 1
+        add_profile_metrics(rows=changed_count)
+        logging.info(f"Changed {changed_count} rows in {batch_count} batches using {sql_file_path}")
+        return changed_count
     except sqlite3.Error as e:
-        logging.exception(f"Error executing JOIN queries: {e}")
+        # Batches committed before the error stay applied
+        logging.exception(f"Error applying batches from {sql_file_path}: {e}")
 
-#This will query the database and sort specified data (like sorting songs by publiscation date).
-def query_sorting(db_file_path, output_file_path):
-    """Perform sorting queries."""
-    try:
-        with sqlite3.connect(db_file_path) as conn:
-            with open(query_sorting_sql_path, 'r') as file:
-                sql_script = file.read()
+#This will insert new artists and update existing ones (matched on artist_id) from dicts or tuples.
+@profile_operation
+def upsert_artists(db_file_path, records, batch_size=mutation_batch_size):
+    """Upsert artist records in batches and return the number of rows changed."""
+    return apply_in_batches(db_file_path, upsert_artists_sql_path, records_to_rows(records, artist_columns), batch_size)
 
-            cursor = conn.cursor()
-            cursor.execute(sql_script)
-            
-            results = cursor.fetchall()
-            write_results_to_file(results, output_file_path, "Sorting Query Results")
-    except sqlite3.Error as e:
-        logging.exception(f"Error executing sorting queries: {e}")
+#This will insert new songs and update existing ones (matched on song_id) from dicts or tuples.
+@profile_operation
+def upsert_songs(db_file_path, records, batch_size=mutation_batch_size):
+    """Upsert song records in batches and return the number of rows changed."""
+    return apply_in_batches(db_file_path, upsert_songs_sql_path, records_to_rows(records, song_columns), batch_size)
 
-#This will update a record already in the database.
-def update_records(db_file_path):
-    """Update records in the database."""
+#This will delete artists by artist_id.
+@profile_operation
+def delete_artists(db_file_path, artist_ids, batch_size=mutation_batch_size):
+    """Delete artists in batches and return the number of rows deleted."""
+    return apply_in_batches(db_file_path, delete_artists_by_id_sql_path, ((artist_id,) for artist_id in artist_ids), batch_size)
+
+#This will delete songs by song_id.
+@profile_operation
+def delete_songs(db_file_path, song_ids, batch_size=mutation_batch_size):
+    """Delete songs in batches and return the number of rows deleted."""
+    return apply_in_batches(db_file_path, delete_songs_by_id_sql_path, ((song_id,) for song_id in song_ids), batch_size)
+
+#This will turn search text into an FTS5 query that matches every word as a prefix, e.g. 'rolling st' becomes '"rolling"* "st"*'.
+def build_search_query(text):
+    """Quote each word of the search text as a prefix term, so quotes and operators in it can't break the query."""
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+#This will search song titles and artist names through the full-text index, e.g. search_songs('rolling', 10).
+@profile_operation
+def search_songs(query, limit=search_result_limit, db_file_path=db_file_path):
+    """Return up to limit (song_id, title, artist_name, rank) rows matching the search text, best matches first."""
+    match_query = build_search_query(query)
+    if not match_query:
+        return []
+    params = {'query': match_query, 'limit': limit}
     try:
-        with sqlite3.connect(db_file_path) as conn:
-            with open(update_records_sql_path, 'r') as file:
-                sql_script = file.read()
-            conn.executescript(sql_script)
-            print(f"Executing UPDATE SQL:\n{sql_script}")  # Log the SQL being executed
-            logging.info(f"Updated records using {update_records_sql_path}")
+        sql_text = load_sql_text(search_songs_sql_path)
+        with get_connection(db_file_path, read_only=True) as conn:
+            record_query_plan(conn, sql_text, params)
+            rows = conn.execute(sql_text, params).fetchall()
+            add_profile_metrics(rows=len(rows))
+            return rows
     except sqlite3.Error as e:
-        logging.exception(f"Error updating records: {e}")
+        logging.exception(f"Error searching songs for {query!r}: {e}")
+
+#This will write batches of rows as the Python tuple text the project has always produced.
+def write_text_results(batches, output_file_path, title, column_names):
+    """Write row batches to a text file, one tuple per line, and return the row count."""
+    row_count = 0
+    with open(output_file_path, 'w', buffering=write_buffer_size) as file:
+        file.write(f"{title}\n")
+        for batch in batches:
+            # One write per batch; map(str, ...) formats each tuple the same way f"{row}" did
+            file.write("\n".join(map(str, batch)))
+            file.write("\n")
+            row_count += len(batch)
+    return row_count
+
+#This will write batches of rows as a CSV file with a header row of column names.
+def write_csv_results(batches, output_file_path, title, column_names):
+    """Write row batches to a CSV file and return the row count."""
+    row_count = 0
+    with open(output_file_path, 'w', newline='', buffering=write_buffer_size) as file:
+        writer = csv.writer(file)
+        for batch in batches:
+            if row_count == 0:
+                writer.writerow(column_names or [f"column_{i}" for i in range(len(batch[0]))])
+            writer.writerows(batch)
+            row_count += len(batch)
+        if row_count == 0 and column_names:
+            writer.writerow(column_names)
+    return row_count
+
+#This will map each column name in the database to the Arrow type of its declared SQLite type, e.g. release_year to int64.
+def declared_column_types(conn):
+    """Return {lowercase column name: pyarrow type} for columns declared with one type affinity across all tables."""
+    import pyarrow as pa
+    column_types = {}
+    declared_columns = conn.execute("SELECT p.name, p.type FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p WHERE m.type = 'table'")
+    for name, declared_type in declared_columns:
+        # SQLite's type affinity rules; NUMERIC and BLOB (or untyped, e.g. full-text) columns can hold anything, so they are skipped
+        declared_type = declared_type.upper()
+        if 'INT' in declared_type:
+            column_type = pa.int64()
+        elif any(part in declared_type for part in ('CHAR', 'CLOB', 'TEXT')):
+            column_type = pa.string()
+        elif any(part in declared_type for part in ('REAL', 'FLOA', 'DOUB')):
+            column_type = pa.float64()
+        else:
+            continue
+        # A name declared with different types in two tables can't tell us which one a result column came from
+        name = name.lower()
+        column_types[name] = column_type if column_types.get(name, column_type) == column_type else None
+    return {name: column_type for name, column_type in column_types.items() if column_type is not None}
+
+#This will turn a list of row tuples into an Arrow record batch.
+def rows_to_record_batch(rows, column_names, schema=None, column_types=None):
+    """Build a record batch from rows, inferring the schema unless one is given."""
+    import pyarrow as pa
+    if isinstance(rows, pa.RecordBatch):
+        # A record batch from the columnar report engine; dictionary-encoded columns are written as plain values
+        columns = [column.dictionary_decode() if pa.types.is_dictionary(column.type) else column for column in rows.columns]
+        column_names = rows.schema.names
+    else:
+        columns = list(zip(*rows))
+    if schema is not None:
+        arrays = [column.cast(field.type) if isinstance(column, pa.Array) else pa.array(column, type=field.type) for column, field in zip(columns, schema)]
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    # Columns that are entirely NULL in the first batch have no type to infer, so they take their declared
+    # SQLite type (later batches are cast to this schema), or string if the column isn't declared anywhere
+    column_names = column_names or [f"column_{i}" for i in range(len(columns))]
+    column_types = column_types or {}
+    arrays = [column if isinstance(column, pa.Array) else pa.array(column) for column in columns]
+    arrays = [array.cast(column_types.get(name.lower(), pa.string())) if pa.types.is_null(array.type) else array for name, array in zip(column_names, arrays)]
+    return pa.RecordBatch.from_arrays(arrays, names=column_names)
+
+#This will stream batches of rows into a Parquet or Arrow IPC file, one record batch per fetch.
+def write_columnar_results(batches, output_file_path, title, column_names, output_format, column_types=None):
+    """Write row batches to a columnar file, keeping the title in the schema metadata, and return the row count."""
+    import pyarrow as pa
+    row_count = 0
+    schema = None
+    writer = None
+    completed = False
+    try:
+        for batch in batches:
+            record_batch = rows_to_record_batch(batch, column_names, schema, column_types)
+            if writer is None:
+                record_batch = record_batch.replace_schema_metadata({'title': title})
+                schema = record_batch.schema
+                writer = open_columnar_writer(output_file_path, schema, output_format)
+            writer.write_batch(record_batch)
+            row_count += len(batch)
+
+        # An empty result still gets a readable file with the column names
+        if writer is None:
+            schema = pa.schema([(name, (column_types or {}).get(name.lower(), pa.string())) for name in column_names or []], metadata={'title': title})
+            writer = open_columnar_writer(output_file_path, schema, output_format)
+        completed = True
+    except pa.ArrowException as e:
+        # Reported as an IOError so callers don't need pyarrow imported to catch it
+        raise IOError(f"Error writing {output_format} file {output_file_path}: {e}") from e
+    finally:
+        if writer is not None:
+            writer.close()
+        if not completed:
+            # Don't leave a truncated file behind that looks like a finished report
+            pathlib.Path(output_file_path).unlink(missing_ok=True)
+    return row_count
+
+#This will open the Parquet or Arrow IPC writer for a schema.
+def open_columnar_writer(output_file_path, schema, output_format):
+    """Return a writer with write_batch() and close() for the columnar output format."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if output_format == 'parquet':
+        return pq.ParquetWriter(output_file_path, schema)
+    return pa.ipc.new_file(output_file_path, schema)
+
+#Output writers by format name, so new formats only need a writer and a suffix.
+result_writers = {
+    'text': write_text_results,
+    'csv': write_csv_results,
+    'parquet': functools.partial(write_columnar_results, output_format='parquet'),
+    'arrow': functools.partial(write_columnar_results, output_format='arrow'),
+}
 
 #This will write the results for a function to a specified file.
-def write_results_to_file(results, output_file_path, title):
-    """Write query results to a file with a title."""
+def write_results_to_file(results, output_file_path, title, batch_size=fetch_batch_size, output_format=default_output_format, column_names=None, column_types=None):
+    """Stream query results from a cursor, iterable or pyarrow Table to a file in the chosen format and return the row count.
+
+    column_types ({column name: pyarrow type}, see declared_column_types()) types the Parquet and Arrow columns
+    that are all NULL in the first batch; for a cursor it is read from the cursor's database.
+    """
+    if output_format not in result_writers:
+        raise ValueError(f"Unknown output format: {output_format}")
     try:
+        # The file suffix follows the format, e.g. join_results.txt becomes join_results.parquet
+        output_file_path = output_file_path.with_suffix(output_suffixes[output_format])
+
          # Ensure the output folder exists
         output_file_path.parent.mkdir(parents=True, exist_ok=True)
 
-        with open(output_file_path, 'w') as file:
-            file.write(f"{title}\n")
-            for row in results:
-                file.write(f"{row}\n")
-        logging.info(f"Wrote results to {output_file_path}")
+        if getattr(results, 'description', None):
+            column_names = [column[0] for column in results.description]
+        if hasattr(results, 'to_batches'):
+            # A Table from the columnar report engine; the Parquet and Arrow writers take its record batches without building rows
+            column_names = results.column_names
+            batches = iter_table_batches(results, batch_size, as_rows=output_format not in columnar_output_formats)
+        else:
+            batches = iter_result_batches(results, batch_size)
+        writer_options = {}
+        if output_format in columnar_output_formats:
+            if column_types is None and isinstance(results, sqlite3.Cursor):
+                column_types = declared_column_types(results.connection)
+            writer_options['column_types'] = column_types
+        row_count = result_writers[output_format](batches, output_file_path, title, column_names, **writer_options)
+        add_profile_metrics(rows=row_count, bytes_written=output_file_path.stat().st_size)
+        logging.info(f"Wrote {row_count} results to {output_file_path}")
+        return row_count
     except IOError as e:
         logging.exception(f"Error writing results to file: {e}")
 
 
 
+#This will run the five independent report queries at the same time, each writing its own output file.
+def run_reports_concurrently(db_file_path, max_workers=report_workers, output_format=default_output_format):
+    """Run the report queries on a thread pool of read-only connections."""
+    import concurrent.futures
+    enable_wal_mode(db_file_path)
+    reports = [
+        (query_aggregation, aggregation_output_file),
+        (query_filter, filter_output_file),
+        (query_group_by, group_by_output_file),
+        (query_join, join_output_file),
+        (query_sorting, sorting_output_file),
+    ]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(query_function, db_file_path, output_file, output_format) for query_function, output_file in reports]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+    logging.info(f"Ran {len(reports)} reports concurrently on {max_workers} workers")
+
+#####################################
+# Columnar Report Engine
+#####################################
+
+#This will tell whether a report can be answered from the columnar snapshot.
+def columnar_reports_usable(name, db_file_path):
+    """Return True if the columnar engine is on, implements the report, and this thread has no uncommitted writes."""
+    # Uncommitted writes on this thread are only visible through SQLite
+    held_connections = getattr(thread_connections, 'held', {})
+    return columnar_reports and name in columnar_report_functions and (str(db_file_path), False) not in held_connections
+
+#This will return a column of a snapshot table by name, ignoring case (songs has an artist_ID column).
+def snapshot_column(table, column_name):
+    """Return the named column of a pyarrow Table, matching the name case-insensitively."""
+    for index, name in enumerate(table.column_names):
+        if name.lower() == column_name:
+            return table.column(index)
+    raise KeyError(column_name)
+
+#This will read the artists and songs tables into columnar Arrow tables, with genre and songs.artist_id dictionary-encoded.
+def load_columnar_snapshot(db_file_path, version):
+    """Return a snapshot dict holding the artists and songs tables as pyarrow Tables in key order."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    tables = {}
+    with get_connection(db_file_path, read_only=True) as conn:
+        # One read transaction, so both tables come from the same commit
+        conn.execute("SAVEPOINT columnar_snapshot")
+        try:
+            column_types = declared_column_types(conn)
+            for table_name, key_column in (('artists', 'artist_id'), ('songs', 'song_id')):
+                cursor = conn.execute(f"SELECT * FROM {table_name} ORDER BY {key_column}")
+                column_names = [column[0] for column in cursor.description]
+                # Every batch gets the declared column types, so batches that differ in which columns are NULL still line up
+                schema = pa.schema([(name, column_types.get(name.lower(), pa.string())) for name in column_names])
+                # Only fetch_batch_size rows are held as Python tuples at a time
+                record_batches = [rows_to_record_batch(rows, column_names, schema) for rows in iter_result_batches(cursor)]
+                tables[table_name] = pa.Table.from_batches(record_batches, schema=schema)
+        finally:
+            conn.execute("RELEASE columnar_snapshot")
+
+    # Each distinct genre and artist_id is stored once; rows hold small integer codes into that dictionary
+    for table_name, column_name in (('artists', 'genre'), ('songs', 'artist_id')):
+        table = tables[table_name]
+        index = [name.lower() for name in table.column_names].index(column_name)
+        tables[table_name] = table.set_column(index, table.field(index).name, pc.dictionary_encode(table.column(index)).combine_chunks())
+    logging.info(f"Loaded columnar snapshot of {db_file_path}: {tables['artists'].num_rows} artists, {tables['songs'].num_rows} songs")
+    return {'db_file_path': str(db_file_path), 'version': version, **tables}
+
+#This will return the columnar snapshot of a database, reloading it only when the database has changed.
+def get_columnar_snapshot(db_file_path):
+    """Return the cached snapshot if it was taken at the current database_version(), else load a new one."""
+    global columnar_snapshot
+    # The version is read before the snapshot, so a commit that lands during the load only makes it stale sooner
+    version = database_version(db_file_path)
+    with columnar_snapshot_lock:
+        snapshot = columnar_snapshot
+        if snapshot is None or snapshot['db_file_path'] != str(db_file_path) or snapshot['version'] != version:
+            # Drop the old snapshot first so two copies are never held at once
+            columnar_snapshot = None
+            snapshot = columnar_snapshot = load_columnar_snapshot(db_file_path, version)
+        return snapshot
+
+#This will drop the columnar snapshot, for example to free its memory after a batch of reports.
+def clear_columnar_snapshot():
+    """Forget the cached columnar snapshot."""
+    global columnar_snapshot
+    with columnar_snapshot_lock:
+        columnar_snapshot = None
+
+#This will count the songs of each artist, like the artist_song_counts table read by query_aggregation.sql and query_group_by.sql.
+def columnar_song_counts(snapshot, params):
+    """Return a table of artist_id and number_of_songs in artist_id order, led by a NULL row for songs without an artist_id."""
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    artist_ids = snapshot_column(snapshot['songs'], 'artist_id').combine_chunks()
+    counts = np.bincount(pc.drop_null(artist_ids.indices).to_numpy(), minlength=len(artist_ids.dictionary))
+    order = pc.sort_indices(artist_ids.dictionary)
+    artist_id_values, song_counts = artist_ids.dictionary.take(order), pa.array(counts).take(order)
+    if artist_ids.null_count:
+        # The SQL counts these from songs and returns them before the artist_song_counts rows
+        artist_id_values = pa.concat_arrays([pa.nulls(1, artist_id_values.type), artist_id_values])
+        song_counts = pa.concat_arrays([pa.array([artist_ids.null_count], song_counts.type), song_counts])
+    return pa.table({'artist_id': artist_id_values, 'number_of_songs': song_counts})
+
+#This will filter artists on genre, like query_filter.sql, e.g. params={'genre': 'Rock'}.
+def columnar_filter(snapshot, params):
+    """Return the artists whose genre equals params['genre'] (or params[0]), in artist_id order."""
+    import numpy as np
+    artists = snapshot['artists']
+    genre = params['genre'] if isinstance(params, dict) else params[0]
+    genres = snapshot_column(artists, 'genre').combine_chunks()
+    # Compare against the few distinct genres once, then match rows by their integer codes
+    codes = np.flatnonzero(genres.dictionary.to_numpy(zero_copy_only=False) == genre)
+    return artists.filter(np.isin(genres.indices.fill_null(-1).to_numpy(), codes))
+
+#This will pair song titles with artist names, like query_join.sql.
+def columnar_join(snapshot, params):
+    """Return artist_name and song_title for every song whose artist exists, in (artist_id, title, song_id) order."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    artists, songs = snapshot['artists'], snapshot['songs']
+    artist_ids = snapshot_column(songs, 'artist_id').combine_chunks()
+    # Look up each distinct artist_id once, then give every song the row of its artist
+    artist_rows = pc.index_in(artist_ids.dictionary, value_set=snapshot_column(artists, 'artist_id')).take(artist_ids.indices)
+    matched = pa.table({
+        'artist_row': artist_rows,
+        'artist_id': snapshot_column(artists, 'artist_id').take(artist_rows),
+        'title': snapshot_column(songs, 'title'),
+        'song_id': snapshot_column(songs, 'song_id'),
+    }).filter(pc.is_valid(artist_rows))
+    # The order SQLite returns the join in when it walks idx_songs_artist_id (artist_id, title)
+    matched = matched.take(pc.sort_indices(matched, sort_keys=[('artist_id', 'ascending'), ('title', 'ascending'), ('song_id', 'ascending')]))
+    return pa.table({'artist_name': snapshot_column(artists, 'name').take(matched['artist_row']), 'song_title': matched['title']})
+
+#This will sort songs newest first, like query_sorting.sql.
+def columnar_sorting(snapshot, params):
+    """Return every song ordered by release_year descending, ties by song_id descending and NULL years last."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    songs = snapshot['songs']
+    # The order SQLite returns when it walks idx_songs_release_year backwards; NULL years sort below every year
+    sort_columns = pa.table({
+        'release_year': pc.fill_null(snapshot_column(songs, 'release_year'), min_sqlite_integer),
+        'song_id': snapshot_column(songs, 'song_id'),
+    })
+    return songs.take(pc.sort_indices(sort_columns, sort_keys=[('release_year', 'descending'), ('song_id', 'descending')]))
+
+#Columnar versions of the report queries by query name; other queries always run on SQLite.
+columnar_report_functions = {
+    'aggregation': columnar_song_counts,
+    'filter': columnar_filter,
+    'group_by': columnar_song_counts,
+    'join': columnar_join,
+    'sorting': columnar_sorting,
+}
+
+#This will run a report against the columnar snapshot.
+def run_columnar_report(name, params, db_file_path):
+    """Return the report as a pyarrow Table, or None if it should run on SQLite instead."""
+    import pyarrow as pa
+    try:
+        return columnar_report_functions[name](get_columnar_snapshot(db_file_path), params)
+    except pa.ArrowException as e:
+        # e.g. a column holding both text and numbers, which SQLite allows but Arrow can't store
+        logging.warning(f"Running the {name} query on SQLite; the columnar engine failed: {e}")
+        return None
+
+#####################################
+# Async API
+#####################################
+
+#This will return the executor the async functions run on, creating it the first time.
+def get_async_executor():
+    """Return the shared thread pool used by the async_* functions."""
+    import concurrent.futures
+    global async_executor
+    with async_executor_lock:
+        if async_executor is None:
+            async_executor = concurrent.futures.ThreadPoolExecutor(max_workers=async_workers, thread_name_prefix='db_operations')
+        return async_executor
+
+#This will run a blocking function on the async executor so the event loop keeps serving other requests.
+async def run_in_async_executor(function, *args, **kwargs):
+    """Await a synchronous db_operations function running on a worker thread."""
+    import asyncio
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_async_executor(), functools.partial(function, *args, **kwargs))
+
+#This will make an awaitable version of a db_operations function, e.g. await async_query_join(db_file_path, join_output_file).
+def async_operation(function):
+    """Return a coroutine function that runs function on the async executor."""
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        return await run_in_async_executor(function, *args, **kwargs)
+    wrapper.__name__ = wrapper.__qualname__ = f"async_{function.__name__}"
+    return wrapper
+
+# Each worker thread borrows a pooled connection for the whole call, and the result file is written on that thread too
+async_insert_new_records = async_operation(insert_new_records)
+async_verify_records = async_operation(verify_records)
+async_delete_records = async_operation(delete_records)
+async_update_records = async_operation(update_records)
+async_run_query = async_operation(run_query)
+async_run_query_to_file = async_operation(run_query_to_file)
+async_query_aggregation = async_operation(query_aggregation)
+async_query_filter = async_operation(query_filter)
+async_query_group_by = async_operation(query_group_by)
+async_query_join = async_operation(query_join)
+async_query_sorting = async_operation(query_sorting)
+async_query_sorting_page = async_operation(query_sorting_page)
+async_query_join_page = async_operation(query_join_page)
+async_upsert_artists = async_operation(upsert_artists)
+async_upsert_songs = async_operation(upsert_songs)
+async_delete_artists = async_operation(delete_artists)
+async_delete_songs = async_operation(delete_songs)
+async_search_songs = async_operation(search_songs)
+
+#This will yield a query's rows in batches without loading the whole result, e.g. to stream an HTTP response.
+async def async_iter_query(name, params=None, db_file_path=db_file_path, batch_size=fetch_batch_size):
+    """Asynchronously yield lists of rows from a registered report query, fetching each batch on the executor."""
+    params = default_query_params.get(name, ()) if params is None else params
+    sql_text = load_query_text(name)
+    # The stream may be resumed on any worker thread, so it gets its own connection instead of a thread's pooled one
+    conn = await run_in_async_executor(open_connection, db_file_path, True)
+    try:
+        cursor = await run_in_async_executor(conn.execute, sql_text, params)
+        while True:
+            batch = await run_in_async_executor(cursor.fetchmany, batch_size)
+            if not batch:
+                break
+            yield batch
+    finally:
+        await run_in_async_executor(conn.close)
+
+#This will run the five report queries at the same time from async code, each writing its own output file.
+async def async_run_reports(db_file_path, output_format=default_output_format):
+    """Run the report queries concurrently on the async executor and return their row counts."""
+    import asyncio
+    await run_in_async_executor(enable_wal_mode, db_file_path)
+    return await asyncio.gather(
+        async_query_aggregation(db_file_path, aggregation_output_file, output_format),
+        async_query_filter(db_file_path, filter_output_file, output_format),
+        async_query_group_by(db_file_path, group_by_output_file, output_format),
+        async_query_join(db_file_path, join_output_file, output_format),
+        async_query_sorting(db_file_path, sorting_output_file, output_format),
+    )
+
+#This will stop the async executor and close the pooled connections, for example when a service shuts down.
+def close_async_executor():
+    """Shut down the async executor after its running calls finish, then stop the writer threads and close the idle pooled connections."""
+    global async_executor
+    with async_executor_lock:
+        if async_executor is not None:
+            async_executor.shutdown(wait=True)
+            async_executor = None
+    stop_writer_threads()
+    close_connection_pool()
+    stop_logging()
+
 #####################################
 #Define Main Function to call functions
 #####################################
 
 def main():
+    configure_logging()
     logging.info("Program started")
     insert_new_records(db_file_path)
     verify_records(db_file_path)
@@ -212,18 +1700,132 @@ def main():
     update_records(db_file_path)
 
     # Specify the output file paths for results
-    query_aggregation(db_file_path, aggregation_output_file)  # Write aggregation results to file
-    query_filter(db_file_path, filter_output_file)  # Write filtered results to file
-    query_group_by(db_file_path, group_by_output_file)  # Write group by results to file
-    query_join(db_file_path, join_output_file)  # Write join results to file
-    query_sorting(db_file_path, sorting_output_file)  # Write sorting results to file
+    if concurrent_reports:
+        run_reports_concurrently(db_file_path)
+    else:
+        query_aggregation(db_file_path, aggregation_output_file)  # Write aggregation results to file
+        query_filter(db_file_path, filter_output_file)  # Write filtered results to file
+        query_group_by(db_file_path, group_by_output_file)  # Write group by results to file
+        query_join(db_file_path, join_output_file)  # Write join results to file
+        query_sorting(db_file_path, sorting_output_file)  # Write sorting results to file
 
+    stop_writer_threads()
+    close_connection_pool()
+    if profiling_enabled:
+        summarize_profiles()
     logging.info("Program ended")
+    stop_logging()
+
+#####################################
+# Command Line Interface
+#####################################
+
+#This will stream a registered query's rows to standard output, e.g. for a shell pipeline.
+def print_query_results(name, db_file_path=db_file_path, output_format='text', params=None):
+    """Write a query's rows to stdout as tuples ('text') or CSV with a header ('csv') and return the row count."""
+    if output_format not in ('text', 'csv'):
+        raise ValueError(f"Only text and csv can be written to standard output, not {output_format}; use --output")
+    params = default_query_params.get(name, ()) if params is None else params
+    sql_text = load_query_text(name)
+    row_count = 0
+    with get_connection(db_file_path, read_only=True) as conn:
+        cursor = conn.execute(sql_text, params)
+        writer = csv.writer(sys.stdout) if output_format == 'csv' else None
+        if writer is not None:
+            writer.writerow([column[0] for column in cursor.description])
+        for batch in iter_result_batches(cursor):
+            if writer is not None:
+                writer.writerows(batch)
+            else:
+                sys.stdout.write("\n".join(map(str, batch)) + "\n")
+            row_count += len(batch)
+    return row_count
+
+#This will build the command line parser.
+def build_argument_parser():
+    """Return the parser for the run, load, verify and search commands."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Music database operations. With no command, runs every operation like before.")
+    parser.add_argument('--db', type=pathlib.Path, default=db_file_path, help="database file (default: %(default)s)")
+    commands = parser.add_subparsers(dest='command')
+
+    run_parser = commands.add_parser('run', help="run a registered report query")
+    run_commands = run_parser.add_subparsers(dest='run_command', required=True)
+    query_parser = run_commands.add_parser('query', help="run sql/query_<name>.sql")
+    query_parser.add_argument('name', help="query name, e.g. join for sql/query_join.sql")
+    query_parser.add_argument('--params', type=json.loads, help='query parameters as JSON, e.g. {"genre": "Rock"}')
+    query_parser.add_argument('--format', dest='output_format', choices=list(output_suffixes), default=default_output_format)
+    query_parser.add_argument('--output', type=pathlib.Path, help="write the results to this file instead of standard output")
+
+    load_parser = commands.add_parser('load', help="create the database and load data/artists.csv and data/songs.csv")
+    load_modes = load_parser.add_mutually_exclusive_group()
+    load_modes.add_argument('--bulk', action='store_true', help="single transaction with tuned PRAGMAs and deferred index builds")
+    load_modes.add_argument('--streaming', action='store_true', help="bounded-memory chunked ingest")
+    load_modes.add_argument('--incremental', action='store_true', help="apply only what changed in the CSV files")
+    load_modes.add_argument('--parallel', action='store_true', help="bulk load with the CSV shards parsed in worker processes")
+    load_parser.add_argument('--workers', type=int, help="worker processes for --parallel (default: one per CPU)")
+    load_parser.add_argument('--artists', type=pathlib.Path, help="artists CSV file, folder of CSV shards or pattern such as 'data/artists-*.csv'")
+    load_parser.add_argument('--songs', type=pathlib.Path, help="songs CSV file, folder of CSV shards or pattern such as 'data/songs-*.csv'")
+
+    verify_parser = commands.add_parser('verify', help="print row counts, null counts, key checks and checksums")
+    verify_parser.add_argument('--sample', type=int, default=verify_sample_size, help="random rows to print per table (default: %(default)s)")
+
+    search_parser = commands.add_parser('search', help="search song titles and artist names")
+    search_parser.add_argument('text', help="words to search for, matched as prefixes, e.g. 'rolling st'")
+    search_parser.add_argument('--limit', type=int, default=search_result_limit, help="maximum number of songs (default: %(default)s)")
+    return parser
+
+#This will run the command given on the command line, e.g. python db_operations_katherine.mcgaughey.py run query join.
+def cli(argv=None):
+    """Parse the command line and run the command, or main() if no command is given."""
+    parser = build_argument_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        main()
+        return
+
+    configure_logging()
+    try:
+        if args.command == 'run':
+            if args.output is not None:
+                run_query_to_file(args.name, args.db, args.output, f"{args.name} Query Results", args.output_format, args.params)
+            else:
+                print_query_results(args.name, args.db, args.output_format, args.params)
+        elif args.command == 'load':
+            # Imported only for load, so the other commands don't pay for pandas
+            import db_initialize_k363m611 as db_initialize
+            db_initialize.db_file_path = args.db
+            if args.artists is not None:
+                db_initialize.artists_data_path = args.artists
+            if args.songs is not None:
+                db_initialize.songs_data_path = args.songs
+            if args.workers is not None:
+                db_initialize.ingest_workers = args.workers
+            db_initialize.initialize_database(
+                streaming=args.streaming or db_initialize.streaming_ingest,
+                bulk=args.bulk or db_initialize.bulk_load,
+                incremental=args.incremental or db_initialize.incremental_sync,
+                parallel=args.parallel or db_initialize.parallel_ingest,
+            )
+        elif args.command == 'verify':
+            verify_records(args.db, args.sample)
+        elif args.command == 'search':
+            for row in search_songs(args.text, args.limit, args.db) or []:
+                print(row)
+    except ValueError as e:
+        parser.error(str(e))
+    except BrokenPipeError:
+        # The reader went away (e.g. piped into head); stop quietly like other command line tools
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    finally:
+        stop_writer_threads()
+        close_connection_pool()
+        stop_logging()
 
 #####################################
 # Conditional Execution
 #####################################
 
-# Conditionally execute the main() function if this is the script being run
+# Run main() with no arguments, or a command such as: run query join --format csv, load --bulk, verify --sample 10, search 'rolling'
 if __name__ == "__main__":
-    main()
+    cli()
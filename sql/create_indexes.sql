@@ -0,0 +1,19 @@
+-- create_indexes.sql
+-- Secondary indexes for the report queries.
+-- IF NOT EXISTS lets us re-run this script against an existing database.
+
+-- query_join.sql and the GROUP BY queries look songs up by artist.
+-- Including title makes the index covering for the join, so songs rows are never read.
+CREATE INDEX IF NOT EXISTS idx_songs_artist_id ON songs (artist_id, title);
+
+-- query_filter.sql filters artists by genre.
+CREATE INDEX IF NOT EXISTS idx_artists_genre ON artists (genre);
+
+-- query_sorting.sql sorts songs by release year; sorting_page.sql seeks on it (the rowid, song_id, ends every entry).
+CREATE INDEX IF NOT EXISTS idx_songs_release_year ON songs (release_year);
+
+-- Duration range filters and sorts use the integer seconds column.
+CREATE INDEX IF NOT EXISTS idx_songs_duration_seconds ON songs (duration_seconds);
+
+-- join_page.sql pages through songs in (artist_id, song_id) order; title makes the index covering.
+CREATE INDEX IF NOT EXISTS idx_songs_artist_id_song_id ON songs (artist_id, song_id, title);
@@ -0,0 +1,70 @@
+-- create_search_tables.sql
+-- Full-text index over song titles and artist names, kept current by triggers on songs and artists.
+-- search_songs() in db_operations queries it through search_songs.sql.
+-- Re-running this script is safe: it only creates what is missing and fills the index if it is empty.
+
+-- rowid is the song_id; remove_diacritics lets 'beyonce' match 'Beyoncé'
+CREATE VIRTUAL TABLE IF NOT EXISTS songs_search USING fts5(
+    title,
+    artist_name,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+
+-- Rank matches in the title twice as highly as matches in the artist name
+INSERT INTO songs_search (songs_search, rank) VALUES ('rank', 'bm25(2.0, 1.0)');
+
+CREATE TRIGGER IF NOT EXISTS songs_search_insert
+AFTER INSERT ON songs
+BEGIN
+    INSERT INTO songs_search (rowid, title, artist_name)
+    VALUES (NEW.song_id, NEW.title, (SELECT name FROM artists WHERE artist_id = NEW.artist_id));
+END;
+
+CREATE TRIGGER IF NOT EXISTS songs_search_delete
+AFTER DELETE ON songs
+BEGIN
+    DELETE FROM songs_search WHERE rowid = OLD.song_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS songs_search_update
+AFTER UPDATE OF song_id, title, artist_id ON songs
+BEGIN
+    DELETE FROM songs_search WHERE rowid = OLD.song_id;
+    INSERT INTO songs_search (rowid, title, artist_name)
+    VALUES (NEW.song_id, NEW.title, (SELECT name FROM artists WHERE artist_id = NEW.artist_id));
+END;
+
+-- Songs can be loaded before their artist, so a new artist fills in its name on them
+CREATE TRIGGER IF NOT EXISTS artists_search_insert
+AFTER INSERT ON artists
+BEGIN
+    UPDATE songs_search SET artist_name = NEW.name
+    WHERE rowid IN (SELECT song_id FROM songs WHERE artist_id = NEW.artist_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS artists_search_delete
+AFTER DELETE ON artists
+BEGIN
+    UPDATE songs_search SET artist_name = NULL
+    WHERE rowid IN (SELECT song_id FROM songs WHERE artist_id = OLD.artist_id);
+END;
+
+-- Upserts rewrite every artist column, so only re-index when the name or id really changed
+CREATE TRIGGER IF NOT EXISTS artists_search_update
+AFTER UPDATE OF artist_id, name ON artists
+WHEN OLD.name IS NOT NEW.name OR OLD.artist_id IS NOT NEW.artist_id
+BEGIN
+    UPDATE songs_search SET artist_name = NULL
+    WHERE rowid IN (SELECT song_id FROM songs WHERE artist_id = OLD.artist_id);
+    UPDATE songs_search SET artist_name = NEW.name
+    WHERE rowid IN (SELECT song_id FROM songs WHERE artist_id = NEW.artist_id);
+END;
+
+-- Index the songs that are missing: all of them when the index is new, or the ones a bulk load
+-- added while the triggers were dropped (it may load into tables that already have songs)
+
+INSERT INTO songs_search (rowid, title, artist_name)
+SELECT s.song_id, s.title, a.name
+FROM songs s
+LEFT JOIN artists a ON a.artist_id = s.artist_id
+WHERE s.song_id NOT IN (SELECT rowid FROM songs_search);
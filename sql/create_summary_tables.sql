@@ -0,0 +1,77 @@
+-- create_summary_tables.sql
+-- Per-artist song counts and duration totals, kept current by triggers on songs.
+-- query_aggregation.sql and query_group_by.sql read this table instead of grouping all songs.
+-- Re-running this script is safe: it only creates what is missing and then rebuilds the totals.
+
+CREATE TABLE IF NOT EXISTS artist_song_counts (
+    artist_id INTEGER PRIMARY KEY,
+    number_of_songs INTEGER NOT NULL,
+    total_duration_seconds INTEGER NOT NULL
+);
+
+-- Durations are stored as 'm:ss' text, so each trigger converts them to seconds. Only digits:digits counts,
+-- the rule the duration_seconds triggers in create_tables.sql and parse_durations() in the loaders use;
+-- anything else adds 0, as a NULL duration_seconds does.
+-- Songs without an artist_id are not counted.
+
+CREATE TRIGGER IF NOT EXISTS songs_summary_insert
+AFTER INSERT ON songs
+WHEN NEW.artist_id IS NOT NULL
+BEGIN
+    INSERT INTO artist_song_counts (artist_id, number_of_songs, total_duration_seconds)
+    VALUES (
+        NEW.artist_id,
+        1,
+        COALESCE(CASE WHEN NEW.duration GLOB '[0-9]*:[0-9]*' AND NEW.duration NOT GLOB '*[^0-9:]*' AND NEW.duration NOT GLOB '*:*:*' THEN CAST(substr(NEW.duration, 1, instr(NEW.duration, ':') - 1) AS INTEGER) * 60 + CAST(substr(NEW.duration, instr(NEW.duration, ':') + 1) AS INTEGER) END, 0)
+    )
+    ON CONFLICT (artist_id) DO UPDATE SET
+        number_of_songs = number_of_songs + 1,
+        total_duration_seconds = total_duration_seconds + excluded.total_duration_seconds;
+END;
+
+CREATE TRIGGER IF NOT EXISTS songs_summary_delete
+AFTER DELETE ON songs
+WHEN OLD.artist_id IS NOT NULL
+BEGIN
+    UPDATE artist_song_counts
+    SET number_of_songs = number_of_songs - 1,
+        total_duration_seconds = total_duration_seconds - COALESCE(CASE WHEN OLD.duration GLOB '[0-9]*:[0-9]*' AND OLD.duration NOT GLOB '*[^0-9:]*' AND OLD.duration NOT GLOB '*:*:*' THEN CAST(substr(OLD.duration, 1, instr(OLD.duration, ':') - 1) AS INTEGER) * 60 + CAST(substr(OLD.duration, instr(OLD.duration, ':') + 1) AS INTEGER) END, 0)
+    WHERE artist_id = OLD.artist_id;
+
+    -- Like GROUP BY, artists without songs have no row
+    DELETE FROM artist_song_counts WHERE artist_id = OLD.artist_id AND number_of_songs = 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS songs_summary_update
+AFTER UPDATE OF artist_id, duration ON songs
+BEGIN
+    UPDATE artist_song_counts
+    SET number_of_songs = number_of_songs - 1,
+        total_duration_seconds = total_duration_seconds - COALESCE(CASE WHEN OLD.duration GLOB '[0-9]*:[0-9]*' AND OLD.duration NOT GLOB '*[^0-9:]*' AND OLD.duration NOT GLOB '*:*:*' THEN CAST(substr(OLD.duration, 1, instr(OLD.duration, ':') - 1) AS INTEGER) * 60 + CAST(substr(OLD.duration, instr(OLD.duration, ':') + 1) AS INTEGER) END, 0)
+    WHERE artist_id = OLD.artist_id;
+
+    DELETE FROM artist_song_counts WHERE artist_id = OLD.artist_id AND number_of_songs = 0;
+
+    INSERT INTO artist_song_counts (artist_id, number_of_songs, total_duration_seconds)
+    SELECT
+        NEW.artist_id,
+        1,
+        COALESCE(CASE WHEN NEW.duration GLOB '[0-9]*:[0-9]*' AND NEW.duration NOT GLOB '*[^0-9:]*' AND NEW.duration NOT GLOB '*:*:*' THEN CAST(substr(NEW.duration, 1, instr(NEW.duration, ':') - 1) AS INTEGER) * 60 + CAST(substr(NEW.duration, instr(NEW.duration, ':') + 1) AS INTEGER) END, 0)
+    WHERE NEW.artist_id IS NOT NULL
+    ON CONFLICT (artist_id) DO UPDATE SET
+        number_of_songs = number_of_songs + 1,
+        total_duration_seconds = total_duration_seconds + excluded.total_duration_seconds;
+END;
+
+-- Rebuild the totals from the songs table, e.g. after a bulk load that ran without the triggers
+
+DELETE FROM artist_song_counts;
+
+INSERT INTO artist_song_counts (artist_id, number_of_songs, total_duration_seconds)
+SELECT
+    artist_id,
+    COUNT(*),
+    SUM(COALESCE(CASE WHEN duration GLOB '[0-9]*:[0-9]*' AND duration NOT GLOB '*[^0-9:]*' AND duration NOT GLOB '*:*:*' THEN CAST(substr(duration, 1, instr(duration, ':') - 1) AS INTEGER) * 60 + CAST(substr(duration, instr(duration, ':') + 1) AS INTEGER) END, 0))
+FROM songs
+WHERE artist_id IS NOT NULL
+GROUP BY artist_id;
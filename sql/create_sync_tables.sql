@@ -0,0 +1,20 @@
+-- create_sync_tables.sql
+-- Bookkeeping for incremental syncs of the CSV files.
+-- IF NOT EXISTS keeps the state from earlier syncs; create_tables.sql drops these tables on a full reload.
+
+-- Size and modification time of each CSV file at its last sync, so an untouched file is skipped entirely
+CREATE TABLE IF NOT EXISTS sync_files (
+    table_name TEXT PRIMARY KEY,
+    csv_path TEXT NOT NULL,
+    csv_size INTEGER NOT NULL,
+    csv_mtime_ns INTEGER NOT NULL,
+    synced_at TEXT NOT NULL
+);
+
+-- A hash of every CSV row loaded so far, keyed by the row's primary key
+CREATE TABLE IF NOT EXISTS sync_row_fingerprints (
+    table_name TEXT NOT NULL,
+    row_key INTEGER NOT NULL,
+    fingerprint BLOB NOT NULL,
+    PRIMARY KEY (table_name, row_key)
+) WITHOUT ROWID;
@@ -0,0 +1,66 @@
+-- Start by deleting any tables if the exist already
+-- We want to be able to re-run this script as needed.
+-- DROP tables in reverse order of creation 
+-- DROP dependent tables (with foreign keys) first
+
+DROP TABLE IF EXISTS songs;
+DROP TABLE IF EXISTS artists;
+
+-- A full reload also forgets what the incremental sync had loaded (see create_sync_tables.sql)
+DROP TABLE IF EXISTS sync_row_fingerprints;
+DROP TABLE IF EXISTS sync_files;
+
+-- The search index is refilled from the new tables by create_search_tables.sql
+DROP TABLE IF EXISTS songs_search;
+
+-- The per-artist summary is rebuilt by create_summary_tables.sql (its triggers go away with songs)
+DROP TABLE IF EXISTS artist_song_counts;
+
+-- Create the artists table
+-- Note that the songs table has a foreign key to the artists table
+-- This means that the songs table is dependent on the artists table
+-- Be sure to create the standalone artists table BEFORE creating the songs table.
+
+CREATE TABLE artists (
+    artist_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    birth_year INTEGER,
+    genre TEXT
+);
+
+-- Create the songs table 
+-- Note that the artists table has no foreign keys, so it is a standalone table
+
+CREATE TABLE songs (
+    song_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    release_year INTEGER,
+    duration TEXT,
+    duration_seconds INTEGER,
+    album TEXT,
+    artist_ID INTEGER,
+    FOREIGN KEY (artist_id) REFERENCES artists (artist_id)
+);
+
+-- duration is 'm:ss' text; duration_seconds holds the same value as an integer for SUM/AVG and range filters.
+-- The CSV loaders fill duration_seconds themselves with a vectorized pandas parse.
+-- These triggers fill it for every other writer (SQL scripts, upserts, updates) that only sets duration.
+-- Like parse_durations() in the loaders, only digits:digits parses (GLOB keeps out '5', 'abc' and '4:30:00');
+-- anything else leaves duration_seconds NULL, so the value doesn't depend on which path wrote the row.
+
+CREATE TRIGGER songs_duration_seconds_insert
+AFTER INSERT ON songs
+WHEN NEW.duration_seconds IS NULL AND NEW.duration GLOB '[0-9]*:[0-9]*' AND NEW.duration NOT GLOB '*[^0-9:]*' AND NEW.duration NOT GLOB '*:*:*'
+BEGIN
+    UPDATE songs
+    SET duration_seconds = CAST(substr(NEW.duration, 1, instr(NEW.duration, ':') - 1) AS INTEGER) * 60 + CAST(substr(NEW.duration, instr(NEW.duration, ':') + 1) AS INTEGER)
+    WHERE song_id = NEW.song_id;
+END;
+
+CREATE TRIGGER songs_duration_seconds_update
+AFTER UPDATE OF duration ON songs
+BEGIN
+    UPDATE songs
+    SET duration_seconds = CASE WHEN NEW.duration GLOB '[0-9]*:[0-9]*' AND NEW.duration NOT GLOB '*[^0-9:]*' AND NEW.duration NOT GLOB '*:*:*' THEN CAST(substr(NEW.duration, 1, instr(NEW.duration, ':') - 1) AS INTEGER) * 60 + CAST(substr(NEW.duration, instr(NEW.duration, ':') + 1) AS INTEGER) END
+    WHERE song_id = NEW.song_id;
+END;
@@ -0,0 +1,5 @@
+-- delete_artists_by_id.sql
+-- The artist_id is bound by delete_artists() in db_operations.
+
+DELETE FROM artists
+WHERE artist_id = ?;
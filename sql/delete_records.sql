@@ -0,0 +1,5 @@
+-- delete_records.sql
+-- :title is bound by delete_records() (defaults to 'Rocket Man')
+
+DELETE FROM songs
+WHERE title = :title;
@@ -0,0 +1,5 @@
+-- delete_songs_by_id.sql
+-- The song_id is bound by delete_songs() in db_operations.
+
+DELETE FROM songs
+WHERE song_id = ?;
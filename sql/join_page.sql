@@ -0,0 +1,29 @@
+-- join_page.sql
+-- One page of query_join.sql in (artist_id, song_id) order, starting after the previous page's last row.
+-- idx_songs_artist_id_song_id serves both the seek and the order, so each page reads only :limit songs.
+-- SQLite seeks only on the first column of a row-value bound, so the key is split into one seek per branch:
+-- the rest of the previous page's artist, then the later artists.
+-- artist_id and song_id are returned so query_join_page() can hand back the key of the next page.
+
+SELECT * FROM (
+    SELECT * FROM (
+        SELECT Artists.name AS artist_name, Songs.title AS song_title, Songs.artist_id, Songs.song_id
+        FROM Songs
+        INNER JOIN Artists ON Songs.artist_id = Artists.artist_id
+        WHERE Songs.artist_id = :after_artist_id AND Songs.song_id > :after_song_id
+        ORDER BY Songs.song_id
+        LIMIT :limit
+    )
+    UNION ALL
+    SELECT * FROM (
+        SELECT Artists.name AS artist_name, Songs.title AS song_title, Songs.artist_id, Songs.song_id
+        FROM Songs
+        INNER JOIN Artists ON Songs.artist_id = Artists.artist_id
+        WHERE Songs.artist_id > :after_artist_id
+        ORDER BY Songs.artist_id, Songs.song_id
+        LIMIT :limit
+    )
+)
+-- At most two pages of rows reach this sort
+ORDER BY artist_id, song_id
+LIMIT :limit;
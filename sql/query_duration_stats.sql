@@ -0,0 +1,11 @@
+-- query_duration_stats.sql
+-- COUNT, SUM and AVG of song durations per artist, computed on the integer duration_seconds column.
+-- format_duration() is registered on every db_operations connection and turns seconds back into 'm:ss'.
+
+SELECT
+    artist_id,
+    COUNT(*) AS number_of_songs,
+    format_duration(SUM(duration_seconds)) AS total_duration,
+    format_duration(CAST(ROUND(AVG(duration_seconds)) AS INTEGER)) AS average_duration
+FROM songs
+GROUP BY artist_id;
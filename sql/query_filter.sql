@@ -0,0 +1,5 @@
+-- query_filter.sql
+-- :genre is bound by query_filter() (defaults to 'Pop')
+
+SELECT * FROM artists
+WHERE genre = :genre;
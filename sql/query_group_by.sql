@@ -0,0 +1,14 @@
+-- query_group_by.sql
+-- Reads the per-artist totals kept current by the triggers in create_summary_tables.sql.
+-- The summary has no row for songs without an artist_id, so they are counted here (an index seek on idx_songs_artist_id)
+-- and come first, as NULL did when this query grouped the songs table.
+
+SELECT artist_id, COUNT(*) AS number_of_songs
+FROM songs
+WHERE artist_id IS NULL
+GROUP BY artist_id
+
+UNION ALL
+
+SELECT artist_id, number_of_songs
+FROM artist_song_counts;
@@ -0,0 +1,4 @@
+-- query_sorting.sql
+
+SELECT * FROM Songs
+ORDER BY release_year DESC;
\ No newline at end of file
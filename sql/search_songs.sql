@@ -0,0 +1,9 @@
+-- search_songs.sql
+-- :query is an FTS5 match expression built by search_songs() and :limit caps the rows returned.
+-- The rank column is the bm25 score set in create_search_tables.sql; lower is a better match.
+
+SELECT rowid AS song_id, title, artist_name, rank
+FROM songs_search
+WHERE songs_search MATCH :query
+ORDER BY rank
+LIMIT :limit;
@@ -0,0 +1,34 @@
+-- sorting_page.sql
+-- One page of query_sorting.sql: newest songs first, songs without a release year last, song_id breaking ties.
+-- Keyset pagination: a page starts after the (release_year, song_id) of the previous page's last row and walks
+-- idx_songs_release_year (whose entries end in song_id, the rowid), so page 10,000 costs the same as page 1.
+-- SQLite seeks only on the first column of a row-value bound, so the key is split into one seek per branch:
+-- the rest of the previous page's year, then the earlier years, then the songs without a year.
+-- :after_release_year and :after_song_id bound the dated songs, :after_null_song_id the undated ones;
+-- query_sorting_page() in db_operations fills them in from the previous page.
+
+SELECT * FROM (
+    SELECT * FROM (
+        SELECT * FROM songs
+        WHERE release_year = :after_release_year AND song_id < :after_song_id
+        ORDER BY song_id DESC
+        LIMIT :limit
+    )
+    UNION ALL
+    SELECT * FROM (
+        SELECT * FROM songs
+        WHERE release_year < :after_release_year
+        ORDER BY release_year DESC, song_id DESC
+        LIMIT :limit
+    )
+    UNION ALL
+    SELECT * FROM (
+        SELECT * FROM songs
+        WHERE release_year IS NULL AND song_id < :after_null_song_id
+        ORDER BY song_id DESC
+        LIMIT :limit
+    )
+)
+-- At most three pages of rows reach this sort
+ORDER BY release_year IS NULL, release_year DESC, song_id DESC
+LIMIT :limit;
@@ -0,0 +1,6 @@
+-- update_records.sql
+-- :duration and :title are bound by update_records() (defaults to '4:30' for 'Let It Be')
+
+UPDATE songs
+SET duration = :duration
+WHERE title = :title;
@@ -0,0 +1,10 @@
+-- upsert_artists.sql
+-- Insert an artist, or update every column if the artist_id already exists.
+-- Parameters are bound in order by upsert_artists() in db_operations.
+
+INSERT INTO artists (artist_id, name, birth_year, genre)
+VALUES (?, ?, ?, ?)
+ON CONFLICT (artist_id) DO UPDATE SET
+    name = excluded.name,
+    birth_year = excluded.birth_year,
+    genre = excluded.genre;
@@ -0,0 +1,12 @@
+-- upsert_songs.sql
+-- Insert a song, or update every column if the song_id already exists.
+-- Parameters are bound in order by upsert_songs() in db_operations.
+
+INSERT INTO songs (song_id, title, release_year, duration, album, artist_id)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (song_id) DO UPDATE SET
+    title = excluded.title,
+    release_year = excluded.release_year,
+    duration = excluded.duration,
+    album = excluded.album,
+    artist_id = excluded.artist_id;